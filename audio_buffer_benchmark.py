@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""Measures the memory allocated (which is mostly copies of the audio) and the time spent by each step of
+the conversions a render goes through when audio effects are applied: reassembling mbrola's output,
+converting it to floats for the effects, and converting the result back to a wav. The conversions done
+with WavBuffer are compared to the ones done with scipy's wavfile and slicing of bytes objects.
+
+Usage: python3 audio_buffer_benchmark.py [duration of the render, in seconds]"""
+import sys
+import tracemalloc
+from io import BytesIO
+from struct import pack
+from time import perf_counter
+
+import numpy as np
+from scipy.io import wavfile
+
+from config import SYNTH_CHUNK_SIZE
+from tools.audio_tools import WavBuffer, BASE_SAMPLING_RATE
+from tools.tools import AudioRenderer
+
+ROUNDS = 20
+
+
+def bytes_join(chunks):
+    wav = b"".join(chunks)
+    return wav[:4] + pack('<I', len(wav) - 8) + wav[8:40] + pack('<I', len(wav) - 44) + wav[44:]
+
+
+def bytes_to_float32(wav):
+    rate, data = wavfile.read(BytesIO(wav))
+    return (data / (2. ** 15)).astype('float32')
+
+
+def bytes_from_float32(data):
+    data = (data * (2. ** 15)).astype("int16")
+    bytes_buff = BytesIO(bytes())
+    wavfile.write(bytes_buff, BASE_SAMPLING_RATE, data)
+    return bytes_buff.read()
+
+
+def buffer_join(chunks):
+    return AudioRenderer.join_chunks(chunks)
+
+
+def buffer_to_float32(wav):
+    return WavBuffer(wav).to_float32()
+
+
+def buffer_from_float32(data):
+    return AudioRenderer.to_wav_bytes(data, BASE_SAMPLING_RATE)
+
+
+def measure(step, make_input):
+    """Returns the memory allocated by the step (its peak, over what was allocated before), and its duration"""
+    allocated, duration = 0, 0
+    for _ in range(ROUNDS):
+        step_input = make_input()
+        tracemalloc.start()
+        start = perf_counter()
+        step(step_input)
+        duration += perf_counter() - start
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return allocated / ROUNDS, duration / ROUNDS
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    samples = (np.random.randn(int(seconds * BASE_SAMPLING_RATE)) * 3000).astype('<i2').tobytes()
+    # mbrola's header, with the size fields unset
+    header = pack('<4sI4s4sIHHIIHH4sI', b"RIFF", 0x7fffffff, b"WAVE", b"fmt ", 16, 1, 1, BASE_SAMPLING_RATE,
+                  BASE_SAMPLING_RATE * 2, 2, 16, b"data", 0x7fffffff)
+    raw = header + samples
+    chunks = [raw[i:i + SYNTH_CHUNK_SIZE] for i in range(0, len(raw), SYNTH_CHUNK_SIZE)]
+    wav = bytes_join(chunks)
+    floats = bytes_to_float32(wav)
+
+    print("render of %gs, %d bytes of wav" % (seconds, len(wav)))
+    print("%-18s | %14s | %14s | %10s | %10s" % ("step", "bytes (scipy)", "bytes (buffer)", "µs (scipy)",
+                                                  "µs (buffer)"))
+    totals = np.zeros(4)
+    for name, old_step, new_step, make_input in (
+            ("join chunks", bytes_join, buffer_join, lambda: chunks),
+            ("wav to float32", bytes_to_float32, buffer_to_float32, lambda: wav),
+            ("float32 to wav", bytes_from_float32, buffer_from_float32, lambda: floats.copy())):
+        (old_bytes, old_time), (new_bytes, new_time) = measure(old_step, make_input), measure(new_step, make_input)
+        totals += (old_bytes, new_bytes, old_time, new_time)
+        print("%-18s | %14d | %14d | %10.1f | %10.1f" % (name, old_bytes, new_bytes, old_time * 1e6, new_time * 1e6))
+    print("%-18s | %14d | %14d | %10.1f | %10.1f" % ("total", totals[0], totals[1], totals[2] * 1e6, totals[3] * 1e6))
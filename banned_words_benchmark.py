@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+"""Compares the time spent checking a message against the banned words with the shared matcher, and with
+the former list of expressions compiled for each user, each one fully matched against the message in turn.
+Messages go from a few words to the maximum length of a message, with and without a banned word (at the end,
+the worst case for the backtracking of ".*word.*").
+
+Usage: python3 banned_words_benchmark.py [number of checks per message]"""
+import sys
+from re import compile as regex
+from time import perf_counter
+
+from config import BANNED_WORDS
+from tools.banned_words import BannedWordsMatcher
+
+LENGTHS = (20, 100, 500)
+
+
+def per_user_censor(banned_words, msg):
+    return any(regex_word.fullmatch(msg) for regex_word in banned_words)
+
+
+def measure(censor, msg, rounds):
+    start = perf_counter()
+    for _ in range(rounds):
+        censor(msg)
+    return (perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_user = [regex(word) for word in BANNED_WORDS]
+    shared = BannedWordsMatcher(BANNED_WORDS)
+
+    print("%-22s | %14s | %14s | %8s" % ("message", "per user (µs)", "shared (µs)", "speedup"))
+    for length in LENGTHS:
+        for banned in (False, True):
+            msg = ("wesh la famille " * length)[:length - 6] + (" trump" if banned else " tramp")
+            assert per_user_censor(per_user, msg) == shared.matches(msg) == banned
+            old = measure(lambda msg: per_user_censor(per_user, msg), msg, rounds)
+            new = measure(shared.matches, msg, rounds)
+            print("%-22s | %14.2f | %14.2f | %7.1fx" % ("%d chars%s" % (length, ", banned" if banned else ""),
+                                                      old * 1e6, new * 1e6, old / new))
+    start = perf_counter()
+    for _ in range(rounds):
+        [regex(word) for word in BANNED_WORDS]
+    print("compiling the list for a new user: %.2fµs (nothing with the shared matcher)"
+          % ((perf_counter() - start) / rounds * 1e6))
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""Measures the CPU time spent by Channel.broadcast on a message and its audio, depending on the number of
+clients in the channel, and compares it to framing the message separately for each client.
+The clients are real autobahn protocol instances, writing to a transport that discards the data.
+
+Usage: python3 broadcast_benchmark.py [number of broadcasts per channel size]"""
+import logging
+import sys
+from asyncio import new_event_loop, set_event_loop
+from time import process_time
+
+from autobahn.asyncio.websocket import WebSocketServerProtocol, WebSocketServerFactory
+from autobahn.websocket.protocol import WebSocketProtocol
+
+from poke import LoultServer, Channel, LoultServerState
+from tools.tools import encode_json
+
+CHANNEL_SIZES = (1, 10, 50, 100, 250, 500)
+MSG = dict(type='msg', userid='8d6a55a2c1e8ef7d', msg='wesh la famille, bien ou quoi ?', date=1500000000000)
+WAV = b'RIFF' + bytes(60 * 1024)  # about the size of a short message's render
+
+
+class NullTransport:
+    written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def get_extra_info(self, name, default=None):
+        return ('127.0.0.1', 0) if name == 'peername' else default
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class BenchLoultServer(LoultServer, WebSocketServerProtocol):
+    loult_state = LoultServerState()
+    client_logger = logging.getLogger('client')
+
+
+def make_channel(factory, size):
+    channel = Channel("bench", BenchLoultServer.loult_state)
+    for _ in range(size):
+        client = factory()
+        client.connection_made(NullTransport())
+        client.state = WebSocketProtocol.STATE_OPEN
+        channel.clients.add(client)
+    return channel
+
+
+def per_client_broadcast(channel, binary_payload, **kwargs):
+    msg = encode_json(kwargs)
+    for client in channel.clients:
+        client.sendMessage(msg)
+        client.send_binary(binary_payload)
+
+
+def measure(broadcast, channel, rounds):
+    start = process_time()
+    for _ in range(rounds):
+        broadcast(channel, binary_payload=WAV, **MSG)
+    return (process_time() - start) / rounds
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    loop = new_event_loop()
+    set_event_loop(loop)
+    factory = WebSocketServerFactory()
+    factory.protocol = BenchLoultServer
+
+    print("%8s | %16s | %16s | %8s" % ("clients", "per client (µs)", "prepared (µs)", "speedup"))
+    for size in CHANNEL_SIZES:
+        channel = make_channel(factory, size)
+        per_client = measure(per_client_broadcast, channel, rounds)
+        prepared = measure(Channel.broadcast, channel, rounds)
+        print("%8d | %16.1f | %16.1f | %7.1fx" % (size, per_client * 1e6, prepared * 1e6, per_client / prepared))
+    loop.close()
@@ -26,6 +26,7 @@ BAN_TIME = 1
 # For example, [r".*\bTrump\b.*"] will match any sentence
 # containing the word "Trump", but won't match "Trumped".
 # For case insensitivity, use (?i) before your regex.
+# The server reloads them from this file when it receives a SIGHUP.
 BANNED_WORDS = [r"(?i).*\bTrump\b.*", r"(?i).*\bfag(got)?\b.*"]
 
 MOD_COOKIES = ["put your cookies here; not their hashes, not userids, the actual cookies' id key"]
@@ -45,3 +46,88 @@ NFTABLES_OUTPUT = 'filter'
 
 # maximum number of simultaneously connected cookies an IP can have
 MAX_COOKIES_PER_IP = 2
+
+# number of synthesis processes (espeak/mbrola) kept spawned in advance for each voice
+SYNTH_WARM_WORKERS = 1
+
+# maximum number of voices for which synthesis processes are kept spawned in advance
+SYNTH_MAX_VOICES = 32
+
+# maximum number of synthesis jobs running at the same time, and maximum number of jobs (running or waiting
+# for a slot) before new messages are rendered without any sound. The renders are already limited by the render
+# scheduler (see RENDER_MAX_CONCURRENCY), which is the limit that matters: by default (None), the synthesis
+# jobs have as many slots as it has, and there are never fewer pending jobs allowed than slots
+SYNTH_MAX_JOBS = None
+SYNTH_MAX_PENDING = 64
+
+# maximum total size (in bytes) of the rendered messages kept in memory, and maximum size of a single render
+# for it to be cached (so that a few long messages don't push out all the short ones)
+RENDER_CACHE_SIZE = 64 * 1024 ** 2
+RENDER_CACHE_MAX_ITEM_SIZE = 256 * 1024
+
+# same as above, for the intermediate renders: the phonemes output by espeak, and the audio output by mbrola
+# when rendering a list of phonemes
+PHONEMES_CACHE_SIZE = 8 * 1024 ** 2
+MBROLA_CACHE_SIZE = 32 * 1024 ** 2
+
+# folder in which rendered messages are also cached, set to None to only use the in-memory cache.
+# Pruning it is up to you (a cron job removing files that haven't been accessed for a while does the trick)
+RENDER_CACHE_DIR = None
+
+# maximum size (in bytes) of the audio chunks read from mbrola, and sent to the clients that
+# receive the audio as a stream
+SYNTH_CHUNK_SIZE = 16 * 1024
+
+# bitrate (in kbit/s) of the opus audio sent to the clients that asked for it with "?codec=opus". Those clients
+# receive wav if opusenc (from the opus-tools package) isn't installed
+OPUS_BITRATE = 24
+# maximum number of opus encodings running at the same time (apart from the synthesis jobs)
+OPUS_MAX_JOBS = 2
+
+# when a client can't keep up with the data sent to it, the messages are queued up to these limits (in bytes,
+# and in number of messages). Over them, the queued sounds are dropped, and if the text messages alone
+# are still over them, the client is disconnected
+CLIENT_QUEUE_MAX_SIZE = 4 * 1024 ** 2
+CLIENT_QUEUE_MAX_LENGTH = 512
+
+# time (in seconds) after which a client that hasn't caught up with the data sent to it is disconnected
+SLOW_CLIENT_TIMEOUT = 60
+
+# interval (in seconds) at which the renders' waits and the channels' outbound queues stats are logged, None to
+# never log them
+STATS_LOG_INTERVAL = 60
+
+# audio effects are rendered out of the event loop, in a pool of worker processes ("process") or
+# threads ("thread"), so they don't block the other connections. None renders them in the event loop
+AUDIO_EFFECTS_EXECUTOR = "process"
+AUDIO_EFFECTS_WORKERS = 2
+
+# users' identities (pokemon, voice, profile) derived from their cookie are kept for that long (in seconds)
+# so that reconnecting doesn't derive them again, up to this number of identities
+IDENTITY_CACHE_TTL = 60 * 60
+IDENTITY_CACHE_SIZE = 4096
+
+# number of the channel's last messages sent to the users when they join it, and to the moderators (whose
+# backlog can be much deeper, the encoded backlog being cached between joins)
+BACKLOG_SIZE = 10
+MOD_BACKLOG_SIZE = 100
+# the channels with their own backlogs' depths, as (users' depth, moderators' depth), e.g. {"cancer": (0, 500)}
+CHANNEL_BACKLOG_SIZES = {}
+
+# the timer wheel holding the effects' expiry and the warnings, bans and reconnection delays: the duration
+# (in seconds) of its ticks, the number of slots of each of its levels, and its number of levels (spanning
+# slots ** levels ticks, the longer timers being put back in the wheel when they come within its span)
+TIMER_WHEEL_RESOLUTION = 1
+TIMER_WHEEL_SLOTS = 64
+TIMER_WHEEL_LEVELS = 3
+
+# maximum number of messages' audio rendered at the same time (None for the number of CPU cores), and time
+# (in seconds) a message waits for its render to start before it's sent without sound
+RENDER_MAX_CONCURRENCY = None
+RENDER_MAX_WAIT = 2
+# the waiting renders of the channels with a lower priority number are served first (the others have 0)
+RENDER_CHANNEL_PRIORITIES = {"cancer": 1}
+
+# a message's audio isn't rendered if its estimated size, times this margin, would still put its user over
+# their rate limit (the estimates being calibrated against the actual renders)
+RENDER_ESTIMATE_MARGIN = 0.8
@@ -5,26 +5,32 @@ import logging
 import wave
 from asyncio import get_event_loop, ensure_future, sleep, gather
 from collections import OrderedDict, deque
-from copy import deepcopy
 from datetime import datetime, timedelta, time
 from functools import lru_cache, wraps
 from hashlib import md5
 from html import escape
 from io import BytesIO
-from itertools import chain
+from itertools import chain, count, islice
 from os import urandom, path
 from re import sub
+from signal import SIGHUP
 from time import time as timestamp
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Set, Tuple, Deque
 
+from autobahn.websocket.protocol import PreparedMessage, WebSocketProtocol
 from autobahn.websocket.types import ConnectionDeny
 
 from config import ATTACK_RESTING_TIME, BAN_TIME, MOD_COOKIES, SOUND_BROADCASTER_COOKIES, MAX_COOKIES_PER_IP, \
-    TIME_BEFORE_TALK, TIME_BETWEEN_CONNECTIONS
+    TIME_BEFORE_TALK, TIME_BETWEEN_CONNECTIONS, CLIENT_QUEUE_MAX_SIZE, CLIENT_QUEUE_MAX_LENGTH, SLOW_CLIENT_TIMEOUT, \
+    BACKLOG_SIZE, MOD_BACKLOG_SIZE, CHANNEL_BACKLOG_SIZES, STATS_LOG_INTERVAL
 from salt import SALT
 from tools.ban import Ban, BanFail
+from tools.clock import clock
+from tools.banned_words import banned_words
 from tools.combat import CombatSimulator
-from tools.tools import INVISIBLE_CHARS, encode_json, OrderedDequeDict
+from tools.scheduler import render_scheduler
+from tools.timers import timer_wheel
+from tools.tools import INVISIBLE_CHARS, encode_json, extend_json, audio_frame, AudioRenderer
 from tools.users import User
 
 
@@ -48,6 +54,13 @@ class ClientLogAdapter(logging.LoggerAdapter):
         return msg, kwargs
 
 
+def prepare_frame(payload: bytes, is_binary=False) -> PreparedMessage:
+    """Builds a websocket frame once, so it can be written as is to any number of clients. The frame is never
+    compressed: with permessage-deflate each connection has its own compression context, so a compressed frame
+    couldn't be shared between clients"""
+    return PreparedMessage(payload, is_binary, applyMask=False, doNotCompress=True)
+
+
 def auto_close(method):
     @wraps(method)
     async def wrapped(*args, **kwargs):
@@ -71,6 +84,8 @@ class LoultServer:
     ip = None
     lasttxt = None
     loult_state = None
+    audio_streaming = False
+    audio_codec = 'wav'
     sendend = None
     user = None
     raw_cookie = None
@@ -79,6 +94,11 @@ class LoultServer:
         if self.client_logger is None or self.loult_state is None:
             raise NotImplementedError('You must override "logger" and "state".')
         self.logger = ClientLogAdapter(self.client_logger, self)
+        # frames waiting for the transport to accept more data, along with whether they can be dropped
+        self.outbound_queue = deque()  # type:Deque[Tuple[PreparedMessage, bool]]
+        self.outbound_size = 0
+        self.dropped_frames = 0
+        self._slow_client_timer = None  # set while the transport's buffer is over its high-water mark
         super().__init__()
 
     def onConnect(self, request):
@@ -87,9 +107,8 @@ class LoultServer:
 
         # checking if this IP's last login isn't too close from this one
         if self.ip in self.loult_state.ip_last_login:
-            if (datetime.now() - self.loult_state.ip_last_login[self.ip]).seconds < TIME_BETWEEN_CONNECTIONS:
-                raise ConnectionDeny(403, 'Wait some time before trying to connect')
-        self.loult_state.ip_last_login[self.ip] = datetime.now()
+            raise ConnectionDeny(403, 'Wait some time before trying to connect')
+        self.loult_state.log_ip(self.ip)
 
         self.logger.info('attempting a connection')
 
@@ -115,8 +134,13 @@ class LoultServer:
         else:
             self.channel_n = request.path.lower().split('/', 2)[-1]
             self.channel_n = sub("/.*", "", self.channel_n)
-        self.sendend = datetime.now()
-        self.lasttxt = datetime.now()
+        self.sendend = clock.now()
+        self.lasttxt = clock.now()
+        # clients opting in with "?stream=1" receive the audio in chunks, as it's rendered
+        self.audio_streaming = request.params.get('stream', ['0'])[0] == '1'
+        # clients opting in with "?codec=opus" receive the whole renders encoded in opus instead of wav
+        if request.params.get('codec', ['wav'])[0] == 'opus' and AudioRenderer.opus_available:
+            self.audio_codec = 'opus'
 
         return None, retn
 
@@ -129,22 +153,78 @@ class LoultServer:
         except UnauthorizedCookie: # this means the user's cookie was denied
             self.sendClose(code=4005, reason='Too many cookies already connected to your IP')
 
-        # copying the channel's userlist info and telling the current JS client which userid is "its own"
-        my_userlist = OrderedDict([(user_id , deepcopy(user.info))
-                                   for user_id, user in self.channel_obj.users.items()])
-        my_userlist[self.user.user_id]['params']['you'] = True  # tells the JS client this is the user's pokemon
-        # sending the current user list to the client
-        self.send_json(type='userlist', users=list(my_userlist.values()))
-        self.send_json(type='backlog', msgs=self.channel_obj.backlog, date=timestamp() * 1000)
+        # sending the current user list to the client, telling it which userid is "its own"
+        self.send_prepared(prepare_frame(self.channel_obj.userlist_payload(self.user)))
+        self.send_prepared(prepare_frame(self.channel_obj.backlog_payload(self.raw_cookie in MOD_COOKIES)))
 
         self.cnx = True  # connected!
         self.logger.info('has fully open a connection')
 
     def send_json(self, **kwargs):
-        self.sendMessage(encode_json(kwargs), isBinary=False)
+        self.send_prepared(prepare_frame(encode_json(kwargs)))
 
     def send_binary(self, payload):
-        self.sendMessage(payload, isBinary=True)
+        self.send_prepared(prepare_frame(payload, is_binary=True), droppable=True)
+
+    def send_prepared(self, frame: PreparedMessage, droppable=False):
+        """Sends a frame, or queues it if the client isn't keeping up. Droppable frames (sounds) are the
+        first to go if the queue gets too big"""
+        # unlike sendMessage, sendPreparedMessage doesn't check that the connection is still open
+        if self.state != WebSocketProtocol.STATE_OPEN:
+            return
+
+        if self._slow_client_timer is None:
+            self.sendPreparedMessage(frame)
+            return
+
+        self.outbound_queue.append((frame, droppable))
+        self.outbound_size += len(frame.payloadHybi)
+        if self.outbound_size > CLIENT_QUEUE_MAX_SIZE or len(self.outbound_queue) > CLIENT_QUEUE_MAX_LENGTH:
+            kept = deque((frame, droppable) for frame, droppable in self.outbound_queue if not droppable)
+            self.dropped_frames += len(self.outbound_queue) - len(kept)
+            self.outbound_queue = kept
+            self.outbound_size = sum(len(frame.payloadHybi) for frame, _ in kept)
+            if self.outbound_size > CLIENT_QUEUE_MAX_SIZE or len(self.outbound_queue) > CLIENT_QUEUE_MAX_LENGTH:
+                self._drop_slow_client('outbound queue is full')
+
+    def pause_writing(self):
+        """Called by the transport when its buffer goes over the high-water mark. Frames are then queued,
+        and the client is disconnected if it hasn't caught up in time"""
+        self._slow_client_timer = get_event_loop().call_later(SLOW_CLIENT_TIMEOUT, self._drop_slow_client,
+                                                              'too slow to receive data')
+
+    def resume_writing(self):
+        """Called by the transport when its buffer drains below the low-water mark"""
+        if self._slow_client_timer is not None:
+            self._slow_client_timer.cancel()
+            self._slow_client_timer = None
+        # sending a frame might fill up the buffer again, in which case pause_writing is called right away
+        while self.outbound_queue and self._slow_client_timer is None and self.state == WebSocketProtocol.STATE_OPEN:
+            frame, _ = self.outbound_queue.popleft()
+            self.outbound_size -= len(frame.payloadHybi)
+            self.sendPreparedMessage(frame)
+
+    def _drop_slow_client(self, reason):
+        self.logger.info('dropped: %s (%d queued frames, %d bytes)'
+                         % (reason, len(self.outbound_queue), self.outbound_size))
+        self._clear_outbound_queue()
+        self.dropConnection(abort=True)
+
+    def _clear_outbound_queue(self):
+        if self._slow_client_timer is not None:
+            self._slow_client_timer.cancel()
+            self._slow_client_timer = None
+        self.outbound_queue.clear()
+        self.outbound_size = 0
+
+    async def _broadcast_render(self, clients: Set['LoultServer'], wav, **msg):
+        """Sends a message along with its audio: the clients taking wav get it right away, and the ones that
+        asked for opus once it's encoded (only once, for all of them)"""
+        opus_clients = {client for client in clients if client.audio_codec == 'opus'} if wav else set()
+        self.channel_obj.broadcast(clients=clients - opus_clients, binary_payload=wav, **msg)
+        if opus_clients:
+            opus = await self.user.audio_renderer.wav_to_opus(wav)
+            self.channel_obj.broadcast(clients=opus_clients, binary_payload=wav, opus_payload=opus, **msg)
 
     def _check_flood(self, msg):
         if not self.user.state.check_flood(msg):
@@ -173,17 +253,25 @@ class LoultServer:
 
     @auto_close
     async def _msg_handler(self, msg_data : Dict):
-        now = datetime.now()
-        if (now - self.user.state.connection_time).seconds < TIME_BEFORE_TALK:
+        now = clock.now()
+        if now - self.user.state.connection_time < TIME_BEFORE_TALK:
             return self.send_json(type='wait',date=timestamp()*1000)
 
         if self._check_flood(msg_data['msg']):
             return
-        # user object instance renders both the output sound and output text
-        output_msg, wav = await self.user.render_message(msg_data["msg"], msg_data.get("lang", "fr"))
+
+        if not self.user.state.is_shadowbanned and "notext" not in msg_data and self.user.can_stream:
+            streaming_clients = {client for client in self.channel_obj.clients if client.audio_streaming}
+            if streaming_clients:
+                return await self._streamed_msg_handler(msg_data, now, streaming_clients)
+
+        # user object instance renders both the output sound and output text, skipping the sound if it
+        # would most likely be over the rate limit
+        output_msg, wav = await self.user.render_message(msg_data["msg"], msg_data.get("lang", "fr"),
+                                                         self._audio_size_left(now))
         # estimating the end of the current voice render, to rate limit
-        calc_sendend = max(self.sendend, now) + timedelta(seconds=len(wav) * 8 / 6000000)
-        synth = calc_sendend < now + timedelta(seconds=2.5)
+        calc_sendend = max(self.sendend, now) + len(wav) * 8 / 6000000
+        synth = calc_sendend < now + 2.5
         if synth:
             self.sendend = calc_sendend
 
@@ -193,29 +281,68 @@ class LoultServer:
         info = self.channel_obj.log_to_backlog(self.user.user_id, output_msg)
         if not self.user.state.is_shadowbanned:
             if "notext" in msg_data and self.raw_cookie in SOUND_BROADCASTER_COOKIES:
-                self.channel_obj.broadcast(type="audio_broadcast", userid=self.user.user_id,
-                                           binary_payload=wav if synth else None)
+                await self._broadcast_render(self.channel_obj.clients, wav if synth else None,
+                                             type="audio_broadcast", userid=self.user.user_id)
             else:
                 # broadcast message and rendered audio to all clients in the channel
-                self.channel_obj.broadcast(type='msg', userid=self.user.user_id,
-                                           msg=output_msg, date=info['date'],
-                                           binary_payload=wav if synth else None)
+                await self._broadcast_render(self.channel_obj.clients, wav if synth else None,
+                                             type='msg', userid=self.user.user_id,
+                                             msg=output_msg, date=info['date'])
         else: # we just send the message to the current client
-            self.send_json(type='msg', userid=self.user.user_id,
-                           msg=output_msg, date=info['date'])
-            if synth:
-                self.send_binary(wav)
+            await self._broadcast_render({self}, wav if synth else None,
+                                         type='msg', userid=self.user.user_id,
+                                         msg=output_msg, date=info['date'])
+
+    def _audio_size_left(self, now: float) -> float:
+        """Size (in bytes) of the audio the user can still send under the rate limit: the end of their
+        renders (counted from their size) has to stay within 2.5 seconds"""
+        return (now + 2.5 - max(self.sendend, now)) * 6000000 / 8
+
+    async def _streamed_msg_handler(self, msg_data : Dict, now : float, streaming_clients : Set['LoultServer']):
+        """The text is sent right away to the clients receiving the audio as a stream, followed by the audio
+        chunks as they're rendered. The other clients receive the text along with the whole audio, once
+        it's fully rendered."""
+        output_msg, chunks = self.user.stream_message(msg_data["msg"], msg_data.get("lang", "fr"),
+                                                      self._audio_size_left(now))
+        output_msg = escape(output_msg)
+        info = self.channel_obj.log_to_backlog(self.user.user_id, output_msg)
+        stream_id = self.channel_obj.new_stream_id()
+        self.channel_obj.broadcast(clients=streaming_clients, type='msg', userid=self.user.user_id,
+                                   msg=output_msg, date=info['date'], stream_id=stream_id)
+
+        # the stream is cut as soon as it goes over the rate limit
+        render_start, render_limit = max(self.sendend, now), now + 2.5
+        wav_chunks, streamed_size, seq, streaming = [], 0, 0, True
+        async for chunk in chunks:
+            wav_chunks.append(chunk)
+            streaming = streaming and \
+                render_start + (streamed_size + len(chunk)) * 8 / 6000000 < render_limit
+            if streaming:
+                self.channel_obj.broadcast(clients=streaming_clients,
+                                           binary_payload=audio_frame(stream_id, seq, chunk))
+                streamed_size += len(chunk)
+                seq += 1
+        # the final frame is never dropped, so the clients always know when a stream is over
+        self.channel_obj.broadcast(clients=streaming_clients, droppable_audio=False,
+                                   binary_payload=audio_frame(stream_id, seq, b"", final=True))
+
+        wav = self.user.audio_renderer.join_chunks(wav_chunks)
+        calc_sendend = render_start + len(wav) * 8 / 6000000
+        synth = calc_sendend < render_limit
+        self.sendend = calc_sendend if synth else render_start + streamed_size * 8 / 6000000
+        await self._broadcast_render(self.channel_obj.clients - streaming_clients, wav if synth else None,
+                                     type='msg', userid=self.user.user_id,
+                                     msg=output_msg, date=info['date'])
 
     @auto_close
     async def _pm_handler(self, msg_data: Dict):
         # cleaning up none values in case of fuckups
         msg_data = {key: value for key, value in msg_data.items() if value is not None}
-        target = self.channel_obj.users.get(msg_data.get("userid"))
-        if target is None:
+        target_clients = self.channel_obj.clients_of(msg_data.get("userid"))
+        if not target_clients:
             self.send_json(type='private_msg', event='invalid')
-        for client in self.channel_obj.clients:
-            if client.user == target:
-                client.send_json(type='private_msg', msg=msg_data["msg"])
+        for client in target_clients:
+            client.send_json(type='private_msg', msg=msg_data["msg"])
 
 
     @auto_close
@@ -251,12 +378,12 @@ class LoultServer:
         adversary_id, adversary = self.channel_obj.get_user_by_name(msg_data.get("target",
                                                                                  self.user.poke_params.pokename),
                                                                     msg_data.get("order", 1) - 1)
-        now = datetime.now()
+        now = clock.now()
 
         # checking if the target user is found, and if the current user has waited long enough to attack
         if adversary is None:
             self.send_json(type='attack', event='invalid')
-        elif (now - self.user.state.last_attack < timedelta(seconds=ATTACK_RESTING_TIME)):
+        elif now - self.user.state.last_attack < ATTACK_RESTING_TIME:
             self.send_json(type='attack', event='invalid')
         else:
             self.channel_obj.broadcast(type='attack', date=timestamp() * 1000,
@@ -323,7 +450,7 @@ class LoultServer:
 
         if "signal_client" in msg_data:
             # before even running the ban, each clients of the concerned user is notified of the ban
-            for client in [client for client in self.channel_obj.clients if client.user and client.user.user_id == user_id]:
+            for client in self.channel_obj.clients_of(user_id):
                 client.send_json(type="banned",
                                  msg="ofwere")
 
@@ -333,8 +460,7 @@ class LoultServer:
                                        flooder_id=user_id,
                                        date=timestamp() * 1000)
 
-        connected_list = {client.ip for client in self.channel_obj.clients
-                          if client.user and client.user.user_id == user_id}
+        connected_list = {client.ip for client in self.channel_obj.clients_of(user_id)}
         backlog_list = {ip for userid, ip in self.loult_state.ip_backlog
                         if userid == user_id}
         todo = connected_list | backlog_list
@@ -381,9 +507,8 @@ class LoultServer:
         if msg_data["action"] == "apply":
             loult_state.trashed_cookies.add(trashed_user.cookie_hash)
             self.send_json(type="trash", userid=user_id, state="apply_ok")
-            for client in self.channel_obj.clients:
-                if client.user is not None and client.user.user_id == user_id:
-                    client.sendClose(code=4006,reason="Reconnect please")
+            for client in self.channel_obj.clients_of(user_id):
+                client.sendClose(code=4006,reason="Reconnect please")
         elif msg_data["action"] == "remove":
             loult_state.trashed_cookies.remove(trashed_user.cookie_hash)
             self.send_json(type="trash", userid=user_id, state="remove_ok")
@@ -448,6 +573,7 @@ class LoultServer:
 
     def onClose(self, wasClean, code, reason):
         """Triggered when the WS connection closes. Mainly consists of deregistering the user"""
+        self._clear_outbound_queue()
         if self.cnx:
             # This lets moderators ban an user even after their disconnection
             self.loult_state.ip_backlog.append((self.user.user_id, self.ip))
@@ -460,44 +586,108 @@ class LoultServer:
 
 class Channel:
 
-    def __init__(self, channel_name, state):
+    def __init__(self, channel_name, state, backlog_size=BACKLOG_SIZE, mod_backlog_size=MOD_BACKLOG_SIZE):
         self.name = channel_name
         self.loult_state = state
         self.clients = set()  # type:Set[LoultServer]
         self.users = OrderedDict()  # type:OrderedDict[str, User]
-        self.backlog = []  # type:List
+        # the last messages, the users getting the backlog_size last ones, and moderators the mod_backlog_size
+        # last ones, encoded when they're first asked for after a new message
+        self.backlog_size, self.mod_backlog_size = backlog_size, mod_backlog_size
+        self.backlog = deque(maxlen=max(backlog_size, mod_backlog_size))  # type:Deque[Dict]
+        self._encoded_backlogs = dict()  # type:Dict[int, bytes]
+        # the users, by their lowercased pokemon name, in the order they connected
+        self._users_by_name = dict()  # type:Dict[str, List[User]]
+        self._stream_ids = count(1)
+        # the userlist message, already encoded, and the positions of each user's info in it
+        self._userlist = None  # type:Tuple[bytes, Dict[str, Tuple[int, int]]]
         # this is used to track how many cookies we have per connected IP in that channel
         self.ip_cookies_tracker = dict()  # type: Dict[str,Set[bytes]]
 
-    def _signal_user_connect(self, client: LoultServer, user: User):
-        client.send_json(type='connect', date=timestamp() * 1000, **user.info)
-
-    def _signal_user_disconnect(self, client: LoultServer, user: User):
-        client.send_json(type='disconnect', date=timestamp() * 1000,
-                         userid=user.user_id)
-
-    def broadcast(self, binary_payload=None, **kwargs):
-        msg = encode_json(kwargs)
-        for client in self.clients:
-            if kwargs:  # in case there is no "text" message to be broadcasted
-                client.sendMessage(msg)
+    def _signal_user_connect(self, user: User, clients: Set[LoultServer]):
+        self.broadcast(clients=clients, json_payload=extend_json({'type': 'connect', 'date': timestamp() * 1000},
+                                                                 user.identity.info_json))
+
+    def _signal_user_disconnect(self, user: User):
+        self.broadcast(type='disconnect', date=timestamp() * 1000, userid=user.user_id)
+
+    def broadcast(self, binary_payload=None, clients=None, opus_payload=None, droppable_audio=True,
+                  json_payload=None, **kwargs):
+        """Sends the message to all the channel's clients, or only to the given ones that are still connected.
+        Clients that asked for opus receive the opus payload instead of the binary one, when there is one.
+        Each frame is built only once, and then written to all the clients. Unless told otherwise, the
+        binary payload is dropped for the clients that don't keep up. The text message can also be given
+        already encoded, as json_payload."""
+        if json_payload is None and kwargs:
+            json_payload = encode_json(kwargs)
+        msg = prepare_frame(json_payload) if json_payload else None  # there might be no "text" message
+        audio_frames = {}  # type:Dict[str, PreparedMessage]
+        for client in (self.clients if clients is None else clients & self.clients):
+            if msg is not None:
+                client.send_prepared(msg)
             if binary_payload:
-                client.send_binary(binary_payload)
+                codec = 'opus' if opus_payload and client.audio_codec == 'opus' else 'wav'
+                if codec not in audio_frames:
+                    audio_frames[codec] = prepare_frame(opus_payload if codec == 'opus' else binary_payload,
+                                                        is_binary=True)
+                client.send_prepared(audio_frames[codec], droppable=droppable_audio)
+
+    @property
+    def outbound_stats(self):
+        """Sizes of the queues of the channel's clients that don't keep up with the data sent to them"""
+        queue_sizes = [client.outbound_size for client in self.clients]
+        return {"clients": len(self.clients),
+                "slow_clients": sum(1 for client in self.clients if client.outbound_queue),
+                "queued_frames": sum(len(client.outbound_queue) for client in self.clients),
+                "queued_bytes": sum(queue_sizes),
+                "max_queued_bytes": max(queue_sizes, default=0),
+                "dropped_frames": sum(client.dropped_frames for client in self.clients)}
+
+    def userlist_payload(self, user: User) -> bytes:
+        """The encoded userlist message, in which the user's own info has the "you" flag. The message is
+        encoded once for all the users, and is only updated when users connect or leave"""
+        if self._userlist is None:
+            encoded, positions = bytearray(b'{"type": "userlist", "users": ['), {}
+            for user_id, channel_user in self.users.items():
+                if positions:
+                    encoded += b", "
+                positions[user_id] = (len(encoded), len(encoded) + len(channel_user.identity.info_json))
+                encoded += channel_user.identity.info_json
+            self._userlist = bytes(encoded + b"]}"), positions
+        encoded, positions = self._userlist
+        start, end = positions[user.user_id]
+        return b"".join((encoded[:start], user.identity.own_info_json, encoded[end:]))
+
+    def _add_to_userlist(self, user: User):
+        if self._userlist is None:
+            return
+        encoded, positions = self._userlist
+        separator = b", " if positions else b""
+        start = len(encoded) - len(b"]}") + len(separator)
+        positions[user.user_id] = (start, start + len(user.identity.info_json))
+        self._userlist = b"".join((encoded[:-len(b"]}")], separator, user.identity.info_json, b"]}")), positions
+
+    def new_stream_id(self):
+        return next(self._stream_ids) & 0xffffffff
 
     def channel_leave(self, client: LoultServer, user: User):
         try:
             self.users[user.user_id].clients.remove(client)
+            self.clients.discard(client)
 
             # if the user is not connected anymore, we signal its disconnect to the others
             if len(self.users[user.user_id].clients) < 1:
-                self.clients.discard(client)
                 del self.users[user.user_id]
+                namesakes = self._users_by_name[user.poke_params.pokename.lower()]
+                namesakes.remove(user)
+                if not namesakes:
+                    del self._users_by_name[user.poke_params.pokename.lower()]
+                self._userlist = None  # the positions of the following users' info have changed
 
                 # removing the client/user's cookie from the ip-cookie tracker
                 self.ip_cookies_tracker[client.ip].remove(client.cookie)
 
-                for client in self.clients:
-                    self._signal_user_disconnect(client, user)
+                self._signal_user_disconnect(user)
 
                 # if no one's connected dans the backlog is empty, we delete the channel from the register
                 if not self.clients and not self.backlog:
@@ -519,10 +709,10 @@ class Channel:
             new_user.state.is_shadowbanned = True
 
         if new_user.user_id not in self.users:
-            for other_client in self.clients:
-                if other_client != client:
-                    self._signal_user_connect(other_client, new_user)
+            self._signal_user_connect(new_user, self.clients - {client})
             self.users[new_user.user_id] = new_user
+            self._users_by_name.setdefault(new_user.poke_params.pokename.lower(), []).append(new_user)
+            self._add_to_userlist(new_user)
             return new_user
         else:
             self.users[new_user.user_id].clients.append(client)
@@ -538,22 +728,33 @@ class Channel:
             'type': kind,
         }
 
-        # adding it to list and removing oldest entry
+        # adding it to the backlog, which drops the oldest entry
         self.backlog.append(info)
-        self.backlog = self.backlog[-10:]
+        self._encoded_backlogs.clear()
         return info
 
-    def get_user_by_name(self, pokemon_name: str, order=0) -> (int, User):
+    def backlog_payload(self, for_mod=False) -> bytes:
+        """The encoded backlog message, which only has to be dated when it's sent"""
+        size = self.mod_backlog_size if for_mod else self.backlog_size
+        if size not in self._encoded_backlogs:
+            self._encoded_backlogs[size] = encode_json(list(islice(self.backlog, max(0, len(self.backlog) - size),
+                                                                   None)))
+        return b'{"type": "backlog", "msgs": %s, "date": %s}' % (self._encoded_backlogs[size],
+                                                                encode_json(timestamp() * 1000))
 
-        for user_id, user in self.users.items():
-            if user.poke_params.pokename.lower() == pokemon_name.lower():
-                if order <= 0:
-                    return user_id, user
-                else:
-                    order -= 1
+    def get_user_by_name(self, pokemon_name: str, order=0) -> (int, User):
+        namesakes = self._users_by_name.get(pokemon_name.lower(), [])
+        if max(order, 0) < len(namesakes):
+            user = namesakes[max(order, 0)]
+            return user.user_id, user
 
         return None, None
 
+    def clients_of(self, user_id: str) -> List[LoultServer]:
+        """The clients connected to the channel as the given user, in a new list"""
+        user = self.users.get(user_id)
+        return list(user.clients) if user is not None else []
+
 
 class LoultServerState:
 
@@ -563,12 +764,16 @@ class LoultServerState:
         self.ip_backlog = deque(maxlen=100) #type: Tuple(str, str)
         self.shadowbanned_cookies = set()
         self.trashed_cookies = set()
-        self.ip_last_login = OrderedDequeDict()
+        # the IPs that connected less than TIME_BETWEEN_CONNECTIONS ago, with their connection's monotonic time
+        self.ip_last_login = {}  # type:Dict[str, float]
+        # the bans', and the IPs' reconnection delays' timers (the same wheel as the users' effects)
+        self.timers = timer_wheel
 
     def channel_connect(self, client : LoultServer, user_cookie : str, channel_name : str) -> Tuple[Channel, User]:
         # if the channel doesn't exist, we instanciate it and add it to the channel dict
         if channel_name not in self.chans:
-            self.chans[channel_name] = Channel(channel_name, self)
+            backlog_size, mod_backlog_size = CHANNEL_BACKLOG_SIZES.get(channel_name, (BACKLOG_SIZE, MOD_BACKLOG_SIZE))
+            self.chans[channel_name] = Channel(channel_name, self, backlog_size, mod_backlog_size)
         channel_obj = self.chans[channel_name]
         channel_obj.clients.add(client)
 
@@ -578,8 +783,19 @@ class LoultServerState:
         if cookie in self.banned_cookies:
             return
         self.banned_cookies.add(cookie)
-        loop = get_event_loop()
-        loop.call_later(BAN_TIME * 60, self.banned_cookies.remove, cookie)
+        self.timers.schedule(BAN_TIME * 60, self.banned_cookies.discard, cookie)
+
+    def log_ip(self, ip: str):
+        self.ip_last_login[ip] = clock.now()
+        self.timers.schedule(TIME_BETWEEN_CONNECTIONS, self.ip_last_login.pop, ip, None)
+
+    def log_stats(self):
+        """Logs the waits of the renders for their turn, and the depth of the outbound queues of each
+        channel's clients"""
+        logger = logging.getLogger('server')
+        logger.info('renders scheduling: %s' % render_scheduler.stats)
+        for channel in self.chans.values():
+            logger.info('channel "%s" outbound queues: %s' % (channel.name, channel.outbound_stats))
 
 
 async def say_hi():
@@ -587,6 +803,12 @@ async def say_hi():
         await sleep(5)
         print("WESH WESH")
 
+
+async def log_stats(state: LoultServerState, interval: float):
+    while True:
+        await sleep(interval)
+        state.log_stats()
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     logger = logging.getLogger('server')
@@ -646,8 +868,13 @@ if __name__ == "__main__":
             autoPingTimeout=30,
         )
 
+    # the banned words are reloaded from the configuration on SIGHUP
+    loop.add_signal_handler(SIGHUP, banned_words.reload)
+
     coro = loop.create_server(factory, '127.0.0.1', 9000)
     scheduler_task = ensure_future(scheduler.start())
+    if STATS_LOG_INTERVAL:
+        ensure_future(log_stats(loult_state, STATS_LOG_INTERVAL))
     server = loop.run_until_complete(gather(coro, scheduler_task))
 
     try:
@@ -1,9 +1,22 @@
+import sys
 import unittest
 from datetime import datetime, timedelta
+from time import monotonic, perf_counter
+from re import compile as regex, error as RegexError
+from tools.banned_words import BannedWordsMatcher, required_literal
 from tools.users import UserState
 from config import FLOOD_DETECTION_MSG_PER_SEC, FLOOD_DETECTION_WINDOW
 
 
+def check_flood_cost(messages_count, msg):
+    """Average time (in seconds) spent checking a message, when messages are sent as fast as possible"""
+    user_state = UserState()
+    start = perf_counter()
+    for i in range(messages_count):
+        user_state.check_flood(msg)
+    return (perf_counter() - start) / messages_count
+
+
 class TestUserState(unittest.TestCase):
 
     def test_is_flooding(self):
@@ -23,6 +36,30 @@ class TestUserState(unittest.TestCase):
         for i in range(flood_nb):
             self.assertFalse(user_state.check_flood(''))
 
+    def test_window_expiry(self):
+        user_state = UserState()
+        flood_nb = FLOOD_DETECTION_MSG_PER_SEC * FLOOD_DETECTION_WINDOW
+        for i in range(flood_nb):
+            user_state.check_flood('')
+        user_state._refresh_timestamps(monotonic() + FLOOD_DETECTION_WINDOW)
+        self.assertEqual(len(user_state.timestamps), 0)
+        self.assertFalse(user_state.check_flood(''))
+
+    def test_high_rate_bounded(self):
+        # the cost of a check doesn't depend on how many messages were sent during the window, since no
+        # more timestamps are kept than needed to tell a flood (see the benchmark for the timings)
+        user_state = UserState()
+        for i in range(20000):
+            user_state.check_flood("wesh")
+        self.assertLessEqual(len(user_state.timestamps), user_state.flood_threshold + 1)
+
+    def test_banned_words_flags(self):
+        user_state = UserState(banned_words=[r"(?i).*\bTrump\b.*", r"[0-9]+"])
+        self.assertTrue(user_state.censor("TRUMP lol"))
+        self.assertFalse(user_state.censor("trumped"))
+        self.assertTrue(user_state.censor("1234"))
+        self.assertFalse(UserState(banned_words=[]).censor(""))
+
     def test_banned_words(self):
         word_list = [".*stuff.*", "^[0-9]{2}.*"]
         user_state = UserState(banned_words=word_list)
@@ -32,5 +69,48 @@ class TestUserState(unittest.TestCase):
         self.assertFalse(user_state.censor("1 something"))
 
 
+class TestBannedWordsMatcher(unittest.TestCase):
+    patterns = [r"(?i).*\bTrump\b.*", r"(?i).*\bfag(got)?\b.*", r".*[0-9]{3}.*", r".*a|b.*", r"^[0-9]{2}.*",
+                r".*\bCaSe\b.*", r"(?s).*dots.*", r".*(x)\1.*", r".*\s.*", r".*\W.*", "(?i).*foo\nbar.*"]
+    messages = ["", "trump", "TRUMP!", "trumped", "a trump\nb", "the fagGot", "fags", "12", "1a", "x123y", "xa",
+                "by", "case", "CaSe ok", "dots\n", "ẞ TRUMP ı", "TRUMP ıİ", "xx", "axxb", "a\nb", "FOO\nbar",
+                "a foo\nbar b", "foo\nbar\nb", "word"]
+
+    def test_same_as_fullmatching_each(self):
+        matcher = BannedWordsMatcher(self.patterns)
+        compiled = [regex(pattern) for pattern in self.patterns]
+        for msg in self.messages:
+            self.assertEqual(matcher.matches(msg), any(pattern.fullmatch(msg) for pattern in compiled), msg)
+        # on their own, so that the expressions matching most messages don't hide the others' mismatches
+        for pattern in self.patterns:
+            matcher = BannedWordsMatcher([pattern])
+            for msg in self.messages:
+                self.assertEqual(matcher.matches(msg), regex(pattern).fullmatch(msg) is not None, (pattern, msg))
+
+    def test_groups(self):
+        # the expressions' groups keep their numbers and names
+        matcher = BannedWordsMatcher([r"(a)b", r"(x)\1", r"(?P<word>a)c", r"(?P<word>d)(?P=word)"])
+        for msg, matched in (("xx", True), ("dd", True), ("ab", True), ("xa", False), ("da", False)):
+            self.assertEqual(matcher.matches(msg), matched, msg)
+
+    def test_required_literal(self):
+        for pattern, literal in ((r"\bTrump\b", "Trump"), (r"\bfag(got)?\b", "fag"), (r"ab?cde", "cde"),
+                                 (r"x[abc]yz\.", "yz."), (r"\x41bc", ""), (r"(x)\1", "")):
+            self.assertEqual(required_literal(pattern), literal)
+
+    def test_invalid_patterns(self):
+        matcher = BannedWordsMatcher([".*trump.*"])
+        with self.assertRaises(RegexError):
+            matcher.load([".*fag.*", "(unclosed"])
+        self.assertTrue(matcher.matches("trump"))
+        self.assertFalse(matcher.matches("fag"))
+
+
 if __name__ == "__main__":
-    unittest.main()
+    if sys.argv[1:] == ["benchmark"]:
+        for messages_count in (100, 1000, 10000, 100000):
+            for length in (10, 500):
+                print("%6d messages of %3d chars: %.2fµs per message"
+                      % (messages_count, length, check_flood_cost(messages_count, "a" * length) * 1e6))
+    else:
+        unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from asyncio import new_event_loop, sleep, wait_for, TimeoutError
+from os import listdir
+from time import sleep as blocking_sleep
+
+import numpy as np
+
+from tools.audio_pool import AudioEffectsPool
+from tools.effects.effects import AudioEffect
+
+
+class EchoEffect(AudioEffect):
+    TIMEOUT = 60
+
+    def process(self, wave_data: np.ndarray):
+        return np.concatenate([wave_data, wave_data * 0.5])
+
+
+class SlowEchoEffect(EchoEffect):
+
+    def process(self, wave_data: np.ndarray):
+        blocking_sleep(0.3)
+        return super().process(wave_data)
+
+
+class TestAudioEffectsPool(unittest.TestCase):
+
+    def _apply(self, executor_type):
+        pool = AudioEffectsPool(executor_type, workers=1)
+        data = np.linspace(-1, 1, 1600, dtype=np.float32)
+        loop = new_event_loop()
+        try:
+            return loop.run_until_complete(pool.apply(data, [EchoEffect()]))
+        finally:
+            pool.close()
+            loop.close()
+
+    def _check_echo(self, output):
+        self.assertEqual(len(output), 3200)
+        self.assertAlmostEqual(float(output[-1]), 0.5, places=5)
+
+    def test_in_loop(self):
+        self._check_echo(self._apply(None))
+
+    def test_thread(self):
+        self._check_echo(self._apply("thread"))
+
+    def test_process(self):
+        shared_blocks = set(listdir("/dev/shm"))
+        self._check_echo(self._apply("process"))
+        self.assertEqual(set(listdir("/dev/shm")), shared_blocks)  # all the shared memory blocks are unlinked
+
+    def test_process_cancelled(self):
+        shared_blocks = set(listdir("/dev/shm"))
+        pool = AudioEffectsPool("process", workers=1)
+        data = np.linspace(-1, 1, 1600, dtype=np.float32)
+
+        async def scenario():
+            with self.assertRaises(TimeoutError):
+                await wait_for(pool.apply(data, [SlowEchoEffect()]), 0.1)
+            await sleep(0.5)  # the worker creates the result's block after the render was cancelled
+
+        loop = new_event_loop()
+        try:
+            loop.run_until_complete(scenario())
+        finally:
+            pool.close()
+            loop.close()
+        self.assertEqual(set(listdir("/dev/shm")), shared_blocks)
+
+
+if __name__ == "__main__":
+    unittest.main()
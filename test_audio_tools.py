@@ -0,0 +1,63 @@
+import unittest
+from io import BytesIO
+from os import path
+from struct import pack
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from scipy.io import wavfile
+
+from tools.audio_tools import WavBuffer, SampleBank
+
+
+class TestWavBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = np.array([0, 1000, -1000, 32767, -32768], dtype='<i2')
+        # mbrola's output, whose header's size fields aren't set
+        header = pack('<4sI4s4sIHHIIHH4sI', b"RIFF", 0x7fffffff, b"WAVE", b"fmt ", 16, 1, 1, 16000, 32000, 2, 16,
+                      b"data", 0x7fffffff)
+        raw = header + self.samples.tobytes()
+        self.chunks = [raw[:30], raw[30:47], raw[47:]]
+
+    def test_from_chunks(self):
+        wav = WavBuffer.from_chunks(self.chunks)
+        self.assertIsInstance(wav.buffer, bytes)
+        self.assertTrue(wav.has_sizes_set)
+        rate, data = wavfile.read(BytesIO(bytes(wav.buffer)))
+        self.assertEqual((rate, wav.rate), (16000, 16000))
+        np.testing.assert_array_equal(data, self.samples)
+        # an already assembled wav isn't copied
+        self.assertIsInstance(WavBuffer.from_chunks([bytes(wav.buffer)]).buffer, bytes)
+
+    def test_float_round_trip(self):
+        floats = WavBuffer.from_chunks(self.chunks).to_float32()
+        self.assertEqual(floats.dtype, np.float32)
+        self.assertAlmostEqual(float(floats[1]), 1000 / 2 ** 15)
+        wav = WavBuffer.from_float32(floats, 16000)
+        self.assertTrue(wav.has_sizes_set)
+        np.testing.assert_array_equal(wav.samples, self.samples)
+
+    def test_from_float32_clips(self):
+        wav = WavBuffer.from_float32(np.array([1.5, -1.5], dtype=np.float32), 16000)
+        np.testing.assert_array_equal(wav.samples, [32767, -32768])
+
+
+class TestSampleBank(unittest.TestCase):
+
+    def test_samples_loaded_once(self):
+        bank = SampleBank()
+        with TemporaryDirectory() as folder:
+            for name, length in (("b.wav", 200), ("a.wav", 100)):
+                wavfile.write(path.join(folder, name), 16000, np.zeros(length, dtype=np.int16))
+            sounds = bank.get_folder(folder)
+            self.assertEqual([len(sound) for sound in sounds], [100, 200])
+            self.assertFalse(sounds[0].flags.writeable)
+            rate, data = bank.get(path.join(folder, "a.wav"))
+            self.assertEqual(rate, 16000)
+            self.assertIs(data, sounds[0])
+            self.assertEqual(bank.size, 600)
+
+
+if __name__ == "__main__":
+    unittest.main()
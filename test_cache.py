@@ -0,0 +1,71 @@
+import unittest
+from asyncio import new_event_loop
+from tempfile import TemporaryDirectory
+
+from tools.cache import RenderCache
+from tools.tools import AudioRenderer
+from tools.users import VoiceParameters
+
+
+class FakeSynthPool:
+
+    def __init__(self):
+        self.calls = 0
+
+    async def stream(self, pipeline, input_data=b""):
+        self.calls += 1
+        yield b"b\t103\na\t80\t0 120 100 120\n"
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = RenderCache(max_size=10, max_item_size=10)
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        self.assertEqual(cache.get("a"), b"12345")  # "a" is now the most recently used
+        cache.put("c", b"12345")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"12345")
+        self.assertEqual(cache.size, 10)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_item_too_big(self):
+        cache = RenderCache(max_size=10, max_item_size=4)
+        cache.put("a", b"12345")
+        self.assertIsNone(cache.get("a"))
+
+    def test_disk_tier(self):
+        loop = new_event_loop()
+        with TemporaryDirectory() as cache_dir:
+            cache = RenderCache(max_size=10, max_item_size=10, disk_dir=cache_dir)
+            key = cache.make_key("wesh", "fr", 120, 50, 3, ())
+            loop.run_until_complete(cache.save(key, b"12345"))
+            other_cache = RenderCache(max_size=10, max_item_size=10, disk_dir=cache_dir)
+            self.assertIsNone(other_cache.get(key))  # only looks up the memory
+            self.assertEqual(loop.run_until_complete(other_cache.load(key)), b"12345")
+            self.assertEqual(other_cache.get(key), b"12345")
+            self.assertEqual((other_cache.hits, other_cache.disk_hits, other_cache.misses), (1, 1, 1))
+            self.assertIsNone(loop.run_until_complete(other_cache.load("missing")))
+        loop.close()
+
+
+class TestPhonemesCache(unittest.TestCase):
+
+    def test_phonemes_copies(self):
+        renderer = AudioRenderer()
+        renderer.pool = FakeSynthPool()
+        renderer.phonemes_cache = RenderCache(max_size=1024, max_item_size=1024)
+        voice_params = VoiceParameters(120, 50, 3)
+        loop = new_event_loop()
+        phonems = loop.run_until_complete(renderer.string_to_phonemes("ba", "fr", voice_params))
+        phonems[0].name = "p"
+        phonems.pop()
+        other_phonems = loop.run_until_complete(renderer.string_to_phonemes("ba", "fr", voice_params))
+        loop.close()
+        self.assertEqual(renderer.pool.calls, 1)
+        self.assertEqual(other_phonems.phonemes_str, "ba")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from tools.effects import dsp
+
+RATE = 16000
+
+
+def sine(freq, duration=2):
+    return (0.5 * np.sin(2 * np.pi * freq * np.arange(duration * RATE) / RATE)).astype(np.float32)
+
+
+def main_frequency(data):
+    return np.argmax(np.abs(np.fft.rfft(data))) * RATE / len(data)
+
+
+class TestDSP(unittest.TestCase):
+
+    def test_comb_matches_freeverb(self):
+        data = np.random.randn(2000)
+        delay, feedback, damping = 37, 0.8, 0.3
+        delay_line, store, expected = [0.] * delay, 0., []
+        for n, sample in enumerate(data):  # freeverb's comb filter, sample by sample
+            output = delay_line[n % delay]
+            store = output + (store - output) * damping
+            delay_line[n % delay] = sample + store * feedback
+            expected.append(output)
+        np.testing.assert_allclose(dsp._comb(data, delay, feedback, damping), expected, atol=1e-9)
+
+    def test_pitch(self):
+        data = sine(200)
+        for shift in (700, -700):
+            output = dsp.DSPChain().pitch(shift)(data, sample_in=RATE, sample_out=RATE)
+            self.assertEqual(len(output), len(data))
+            self.assertEqual(output.dtype, np.float32)
+            self.assertAlmostEqual(main_frequency(output), 200 * 2 ** (shift / 1200), delta=2)
+
+    def test_band_pass(self):
+        chain = dsp.DSPChain().sinc(high_pass_frequency=700, low_pass_frequency="3k")
+        for freq, passes in ((200, False), (1500, True), (5000, False)):
+            output = chain(sine(freq), sample_in=RATE)[RATE // 2:-RATE // 2]
+            self.assertEqual(np.sqrt(np.mean(output ** 2)) > 0.3, passes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from tools.estimator import RenderSizeEstimator
+
+
+class TestRenderSizeEstimator(unittest.TestCase):
+
+    def test_calibration(self):
+        estimator = RenderSizeEstimator(margin=0.8)
+        # renders of 2000 bytes per character at 100 words per minute
+        for length in (10, 50, 20, 80) * 50:
+            estimator.calibrate("a" * length, 100, 2000 * length)
+        self.assertAlmostEqual(estimator.estimate("a" * 30, 100), 60000, delta=600)
+        self.assertAlmostEqual(estimator.estimate("a" * 30, 50), 120000, delta=1200)
+        self.assertLess(estimator.stats["mean_error"], 0.01)
+        self.assertEqual(estimator.stats["calibrations"], 200)
+
+    def test_phonemes_calibration(self):
+        estimator = RenderSizeEstimator()
+        for duration in (100, 400, 250) * 50:
+            estimator.calibrate("ab", 100, 40 * duration, phonemes_duration=duration)
+        self.assertAlmostEqual(estimator.estimate("whatever", 100, phonemes_duration=1000), 40000, delta=400)
+
+    def test_fits_with_margin(self):
+        estimator = RenderSizeEstimator(margin=0.8)
+        estimator.bytes_per_char = 1000
+        # estimated to 10000 bytes, ruled out only under 8000 bytes
+        self.assertTrue(estimator.fits("a" * 10, 1, 9000))
+        self.assertFalse(estimator.fits("a" * 10, 1, 7000))
+        self.assertFalse(estimator.fits("", 1, 0))
+        self.assertEqual(estimator.stats["skipped"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from tools.lexicon import StringTable, RhymesLexicon, FIELDS_SEPARATOR, rhyme_key, verbs_lexicon
+
+
+class TestLexicons(unittest.TestCase):
+
+    def test_string_table(self):
+        with TemporaryDirectory() as folder:
+            filepath = path.join(folder, "table.sst")
+            StringTable.write(filepath, ["manger", "mangé", "abaisser", "manger", "zozoter"])
+            table = StringTable(filepath)
+            self.assertEqual(list(table), [b"abaisser", b"manger", b"mang\xc3\xa9", b"zozoter"])
+            self.assertIn(b"manger", table)
+            self.assertNotIn(b"mange", table)
+            self.assertEqual(table.prefix_range(b"mang"), range(1, 3))
+
+    def test_unsorted_table(self):
+        with TemporaryDirectory() as folder:
+            filepath = path.join(folder, "table.sst")
+            StringTable.write(filepath, ["Ozan\t01", "Péron\t01", "", "Ozan\t01"], sort=False)
+            table = StringTable(filepath)
+            self.assertEqual(len(table), 4)
+            self.assertEqual([table.string(index) for index in range(4)], ["Ozan\t01", "Péron\t01", "", "Ozan\t01"])
+            with self.assertRaises(IndexError):
+                table.string(4)
+
+    def test_verbs(self):
+        for verb in ("abaissa", "zigzaguai", "ôtés"):
+            self.assertIn(verb, verbs_lexicon)
+        for word in ("zigzag", "zigzaguaixyz", "ôté_", ""):
+            self.assertNotIn(word, verbs_lexicon)
+
+    def test_rhymes(self):
+        words = [(["o"], "eau", "f", "s"), (["s", "o"], "saut", "m", "s"), (["p", "y", "s", "o"], "puceau", "m", "s"),
+                 (["R", "@", "s", "o"], "ressaut", "m", "s"), (["a~"], "an", "m", "s")]
+        with TemporaryDirectory() as folder:
+            filepath = path.join(folder, "rhymes.sst")
+            StringTable.write(filepath, (FIELDS_SEPARATOR.join((rhyme_key(phonemes), text, genre, nombre))
+                                         for phonemes, text, genre, nombre in words))
+            lexicon = RhymesLexicon(filepath)
+            for _ in range(10):
+                self.assertIn(lexicon.find_rhyme_of_phonemes(["_", "b", "y", "s", "o", "_"], "bussot").text,
+                              ("puceau", "ressaut", "saut"))
+            for _ in range(10):  # the word itself isn't picked
+                self.assertIn(lexicon.find_rhyme_of_phonemes(["p", "y", "s", "o"], "puceau").text, ("ressaut", "saut"))
+            self.assertEqual(lexicon.find_rhyme_of_phonemes(["b", "a~"], "banc").genre, "m")
+            self.assertIsNone(lexicon.find_rhyme_of_phonemes(["i"], "y"))
+
+
+if __name__ == "__main__":
+    unittest.main()
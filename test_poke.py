@@ -0,0 +1,274 @@
+import json
+import logging
+import unittest
+from asyncio import new_event_loop, set_event_loop, sleep
+from unittest.mock import patch
+
+from autobahn.asyncio.websocket import WebSocketServerProtocol, WebSocketServerFactory
+from autobahn.websocket.protocol import WebSocketProtocol
+
+import poke
+from poke import LoultServer, LoultServerState, prepare_frame
+from tools.tools import encode_json
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.written = []
+        self.aborted = False
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def get_extra_info(self, name, default=None):
+        return ('127.0.0.1', 0) if name == 'peername' else default
+
+    def is_closing(self):
+        return self.aborted
+
+    def close(self):
+        self.aborted = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class FakeLoultServer(LoultServer, WebSocketServerProtocol):
+    loult_state = LoultServerState()
+    client_logger = logging.getLogger('client')
+
+
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = new_event_loop()
+        set_event_loop(self.loop)
+        self.factory = WebSocketServerFactory()
+        self.factory.protocol = FakeLoultServer
+
+    def tearDown(self):
+        self.loop.close()
+        set_event_loop(None)
+
+    def make_client(self) -> FakeLoultServer:
+        client = self.factory()
+        client.connection_made(FakeTransport())
+        client.state = WebSocketProtocol.STATE_OPEN
+        return client
+
+
+class TestOutboundQueue(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.make_client()
+        self.text_frames = [prepare_frame(b'{"msg": %d}' % i) for i in range(3)]
+        self.audio_frames = [prepare_frame(b"RIFF%d" % i, is_binary=True) for i in range(3)]
+
+    def written(self):
+        return self.client.transport.written
+
+    def test_flushed_in_order(self):
+        self.client.pause_writing()
+        sent = [self.text_frames[0], self.audio_frames[0], self.text_frames[1]]
+        for frame in sent:
+            self.client.send_prepared(frame, droppable=frame in self.audio_frames)
+        self.assertEqual(self.written(), [])
+        self.assertEqual(len(self.client.outbound_queue), 3)
+
+        self.client.resume_writing()
+        self.assertEqual(self.written(), [frame.payloadHybi for frame in sent])
+        self.assertEqual((len(self.client.outbound_queue), self.client.outbound_size), (0, 0))
+        self.client.send_prepared(self.text_frames[2])  # sent right away
+        self.assertEqual(self.written()[-1], self.text_frames[2].payloadHybi)
+
+    def test_audio_dropped_before_text(self):
+        self.client.pause_writing()
+        with patch.object(poke, "CLIENT_QUEUE_MAX_LENGTH", 4):
+            for text, audio in zip(self.text_frames, self.audio_frames):
+                self.client.send_prepared(text)
+                self.client.send_prepared(audio, droppable=True)
+        # the sounds were dropped when the fifth frame was queued, the last one being queued afterwards
+        self.assertEqual([frame for frame, _ in self.client.outbound_queue], self.text_frames + self.audio_frames[2:])
+        self.assertEqual(self.client.dropped_frames, 2)
+        self.assertFalse(self.client.transport.aborted)
+        self.client.resume_writing()
+        self.assertEqual(self.written(), [frame.payloadHybi for frame in self.text_frames + self.audio_frames[2:]])
+
+    def test_evicted_over_length(self):
+        self.client.pause_writing()
+        with patch.object(poke, "CLIENT_QUEUE_MAX_LENGTH", 2):
+            for frame in self.text_frames:
+                self.client.send_prepared(frame)
+        self.assertTrue(self.client.transport.aborted)
+        self.assertEqual(self.client.state, WebSocketProtocol.STATE_CLOSED)
+        self.assertEqual((len(self.client.outbound_queue), self.client.outbound_size), (0, 0))
+        self.assertIsNone(self.client._slow_client_timer)
+
+    def test_evicted_over_size(self):
+        self.client.pause_writing()
+        with patch.object(poke, "CLIENT_QUEUE_MAX_SIZE", 100):
+            self.client.send_prepared(prepare_frame(b"a" * 50))
+            self.assertFalse(self.client.transport.aborted)
+            self.client.send_prepared(prepare_frame(b"a" * 50))
+        self.assertTrue(self.client.transport.aborted)
+
+    def test_slow_client_timeout(self):
+        caught_up_client = self.make_client()
+        with patch.object(poke, "SLOW_CLIENT_TIMEOUT", 0.05):
+            self.client.pause_writing()
+            caught_up_client.pause_writing()
+            self.client.send_prepared(self.text_frames[0])
+            caught_up_client.resume_writing()
+            self.loop.run_until_complete(sleep(0.1))
+        self.assertTrue(self.client.transport.aborted)
+        self.assertEqual(len(self.client.outbound_queue), 0)
+        self.assertFalse(caught_up_client.transport.aborted)
+
+
+
+class ChannelTestCase(ServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.state = LoultServerState()
+
+    def connect(self, cookie: bytes) -> FakeLoultServer:
+        client = self.make_client()
+        client.ip, client.cookie = cookie.hex(), cookie  # one IP per cookie, so that none of them is refused
+        client.channel_obj, client.user = self.state.channel_connect(client, cookie, "chan")
+        return client
+
+    @staticmethod
+    def leave(client: FakeLoultServer):
+        client.channel_obj.channel_leave(client, client.user)
+
+
+class TestUserlist(ChannelTestCase):
+
+    def check_userlists(self, users):
+        """Each user's userlist is the same as the plain encoded one, the users being in the given order"""
+        channel = self.state.chans["chan"]
+        for user in users:
+            plain_userlist = [dict(other.info, params=dict(other.info['params'], you=True)) if other is user
+                              else other.info for other in users]
+            self.assertEqual(channel.userlist_payload(user),
+                             encode_json({"type": "userlist", "users": plain_userlist}))
+
+    def test_connecting(self):
+        users = []
+        for i in range(4):
+            users.append(self.connect(bytes([i]) * 16).user)
+            self.check_userlists(users)  # the encoded userlist is extended, and not encoded again
+
+    def test_leaving(self):
+        clients = [self.connect(bytes([i]) * 16) for i in range(5)]
+        self.check_userlists([client.user for client in clients])
+        self.leave(clients.pop(2))
+        self.check_userlists([client.user for client in clients])
+        self.leave(clients.pop(0))
+        self.leave(clients.pop())
+        clients.append(self.connect(b"\x05" * 16))
+        self.check_userlists([client.user for client in clients])
+
+    def test_user_with_several_clients(self):
+        first_client, other_user_client = self.connect(b"\x00" * 16), self.connect(b"\x01" * 16)
+        second_client = self.connect(b"\x00" * 16)
+        self.assertIs(first_client.user, second_client.user)
+        users = [first_client.user, other_user_client.user]
+        self.check_userlists(users)
+        self.leave(first_client)  # the user is still connected through its other client
+        self.check_userlists(users)
+        self.leave(second_client)
+        self.check_userlists(users[1:])
+
+
+
+class TestUsersLookup(ChannelTestCase):
+
+    @staticmethod
+    def namesakes_cookies(count):
+        """Cookies of different users that get the same pokemon"""
+        from tools.users import PokeParameters
+        cookies_by_name = {}
+        for i in range(10000):
+            cookie = i.to_bytes(16, "big")
+            cookies = cookies_by_name.setdefault(PokeParameters.from_cookie_hash(cookie).pokename, [])
+            cookies.append(cookie)
+            if len(cookies) == count:
+                return cookies
+
+    def test_namesakes(self):
+        clients = [self.connect(cookie) for cookie in self.namesakes_cookies(3)]
+        channel, name = self.state.chans["chan"], clients[0].user.poke_params.pokename
+        for order, client in enumerate(clients):
+            self.assertEqual(channel.get_user_by_name(name.upper(), order), (client.user.user_id, client.user))
+        self.assertEqual(channel.get_user_by_name(name, 3), (None, None))
+        self.assertEqual(channel.get_user_by_name(name, -1), (clients[0].user.user_id, clients[0].user))
+
+        self.leave(clients.pop(1))  # the following namesakes move up
+        self.assertIs(channel.get_user_by_name(name, 1)[1], clients[1].user)
+        for client in clients:
+            self.leave(client)
+        self.assertEqual(channel.get_user_by_name(name), (None, None))
+
+    def test_clients_of(self):
+        first_client, other_user_client = self.connect(b"\x00" * 16), self.connect(b"\x01" * 16)
+        second_client = self.connect(b"\x00" * 16)
+        channel, user_id = self.state.chans["chan"], first_client.user.user_id
+        clients = channel.clients_of(user_id)
+        self.assertEqual(clients, [first_client, second_client])
+        clients.clear()  # it's a copy
+        self.assertEqual(channel.clients_of(other_user_client.user.user_id), [other_user_client])
+
+        self.leave(first_client)
+        self.assertEqual(channel.clients_of(user_id), [second_client])
+        self.leave(second_client)
+        self.assertEqual(channel.clients_of(user_id), [])
+        self.assertEqual(channel.clients_of("unknown"), [])
+
+
+
+class TestBacklog(ChannelTestCase):
+
+    def log_messages(self, channel, user, count):
+        for i in range(count):
+            channel.log_to_backlog(user.user_id, "message %d" % i)
+
+    @staticmethod
+    def backlog_messages(payload: bytes):
+        return [entry["msg"] for entry in json.loads(payload)["msgs"]]
+
+    def test_depths(self):
+        with patch.object(poke, "CHANNEL_BACKLOG_SIZES", {"chan": (3, 5)}):
+            client = self.connect(b"\x00" * 16)
+        channel = client.channel_obj
+        self.log_messages(channel, client.user, 8)
+        self.assertEqual(len(channel.backlog), 5)
+        self.assertEqual(self.backlog_messages(channel.backlog_payload()), ["message %d" % i for i in range(5, 8)])
+        self.assertEqual(self.backlog_messages(channel.backlog_payload(for_mod=True)),
+                         ["message %d" % i for i in range(3, 8)])
+
+    def test_default_depths(self):
+        client = self.connect(b"\x00" * 16)
+        channel = client.channel_obj
+        self.log_messages(channel, client.user, poke.MOD_BACKLOG_SIZE + 1)
+        self.assertEqual(len(json.loads(channel.backlog_payload())["msgs"]), poke.BACKLOG_SIZE)
+        self.assertEqual(len(json.loads(channel.backlog_payload(for_mod=True))["msgs"]), poke.MOD_BACKLOG_SIZE)
+
+    def test_encoded_backlog_reused(self):
+        client = self.connect(b"\x00" * 16)
+        channel = client.channel_obj
+        self.log_messages(channel, client.user, 3)
+        channel.backlog_payload()
+        encoded = channel._encoded_backlogs[channel.backlog_size]
+        channel.backlog_payload()
+        self.assertIs(channel._encoded_backlogs[channel.backlog_size], encoded)
+        channel.log_to_backlog(client.user.user_id, "new message")
+        self.assertEqual(self.backlog_messages(channel.backlog_payload())[-1], "new message")
+        self.assertIsNot(channel._encoded_backlogs[channel.backlog_size], encoded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+from tools.scheduler import RenderScheduler
+
+
+class TestRenderScheduler(unittest.TestCase):
+
+    def run_renders(self, scheduler, renders, duration=0.01):
+        """Runs the (user, priority) renders queued in that order, returning the order in which they ran, or
+        None for the dropped ones"""
+        order = []
+
+        async def render(index, user, priority):
+            if not await scheduler.acquire(user, priority):
+                order.append((None, index))
+                return
+            try:
+                order.append((user, index))
+                await asyncio.sleep(duration)
+            finally:
+                scheduler.release()
+
+        async def run_all():
+            await asyncio.gather(*(render(index, user, priority) for index, (user, priority) in enumerate(renders)))
+        asyncio.run(run_all())
+        return order
+
+    def test_users_take_turns(self):
+        scheduler = RenderScheduler(max_renders=1)
+        order = self.run_renders(scheduler, [("a", 0)] * 4 + [("b", 0)] * 2 + [("c", 0)])
+        self.assertEqual([user for user, _ in order], ["a", "a", "b", "c", "a", "b", "a"])
+        self.assertEqual(scheduler.stats["granted"], 7)
+        self.assertEqual((scheduler.running, scheduler.queued), (0, 0))
+
+    def test_priority(self):
+        scheduler = RenderScheduler(max_renders=1)
+        order = self.run_renders(scheduler, [("a", 1), ("a", 1), ("b", 0), ("c", 1), ("d", 0)])
+        self.assertEqual([user for user, _ in order], ["a", "b", "d", "a", "c"])
+
+    def test_concurrency(self):
+        scheduler, running = RenderScheduler(max_renders=3), []
+
+        async def render():
+            self.assertTrue(await scheduler.acquire("a"))
+            running.append(scheduler.running)
+            await asyncio.sleep(0.01)
+            scheduler.release()
+
+        async def run_all():
+            await asyncio.gather(*(render() for _ in range(10)))
+        asyncio.run(run_all())
+        self.assertEqual(max(running), 3)
+
+    def test_deadline(self):
+        scheduler = RenderScheduler(max_renders=1, max_wait=0.05)
+        order = self.run_renders(scheduler, [("a", 0), ("b", 0), ("c", 0)], duration=0.04)
+        # b starts rendering in time, c waits for too long
+        self.assertEqual(order, [("a", 0), ("b", 1), (None, 2)])
+        self.assertEqual(scheduler.stats["dropped"], 1)
+        self.assertGreater(scheduler.stats["max_wait"], 0.03)
+
+    def test_cancelled_wait(self):
+        scheduler = RenderScheduler(max_renders=1)
+
+        async def run():
+            self.assertTrue(await scheduler.acquire("a"))
+            waiting = asyncio.ensure_future(scheduler.acquire("b"))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            scheduler.release()  # while the waiting task is being cancelled
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertTrue(await scheduler.acquire("c"))
+            scheduler.release()
+        asyncio.run(run())
+        self.assertEqual((scheduler.running, scheduler.queued), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from asyncio import new_event_loop, sleep
+
+from tools import synth_pool
+from tools.scheduler import render_scheduler
+from tools.synth_pool import SynthPool, SynthPoolFull, SynthWorker, WorkerCrashed
+
+CAT = (("cat",),)
+CAT_CAT = (("cat",), ("cat",))
+
+
+class TestSynthPool(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_run_and_refill(self):
+        pool = SynthPool(warm_workers=1, max_voices=2, max_jobs=2, max_pending=4)
+
+        async def scenario():
+            self.assertEqual(await pool.run(CAT, b"wesh"), b"wesh")
+            await sleep(0.2)  # leaving some time for the background refill
+            self.assertEqual(len(pool._idle[CAT]), 1)
+            self.assertEqual(await pool.run(CAT, b"lol"), b"lol")
+            pool.close()
+            await sleep(0.2)
+
+        self.loop.run_until_complete(scenario())
+
+    def test_pipeline(self):
+        pool = SynthPool(warm_workers=1, max_voices=2, max_jobs=2, max_pending=4)
+
+        async def scenario():
+            self.assertEqual(await pool.run(CAT_CAT, b"wesh" * 100000), b"wesh" * 100000)
+            pool.close()
+            await sleep(0.2)
+
+        self.loop.run_until_complete(scenario())
+
+    def test_voices_eviction(self):
+        pool = SynthPool(warm_workers=1, max_voices=1, max_jobs=2, max_pending=4)
+
+        async def scenario():
+            await pool.run(CAT, b"wesh")
+            await pool.run(CAT_CAT, b"wesh")
+            await sleep(0.2)
+            self.assertEqual(list(pool._idle), [CAT_CAT])
+            pool.close()
+            await sleep(0.2)
+
+        self.loop.run_until_complete(scenario())
+
+    def test_crashed_worker(self):
+        pool = SynthPool(warm_workers=1, max_voices=1, max_jobs=2, max_pending=4)
+
+        async def scenario():
+            with self.assertRaises(WorkerCrashed):
+                await pool.run((("false",),), b"")
+            await sleep(0.2)
+            pool.close()
+            await sleep(0.2)
+
+        self.loop.run_until_complete(scenario())
+        self.assertGreaterEqual(pool.crashes, 1)
+
+    def test_failed_spawn_reaps_started_stages(self):
+        started = []
+        create_subprocess_exec = synth_pool.create_subprocess_exec
+
+        async def recording_exec(*args, **kwargs):
+            started.append(await create_subprocess_exec(*args, **kwargs))
+            return started[-1]
+
+        synth_pool.create_subprocess_exec = recording_exec
+        try:
+            with self.assertRaises(OSError):
+                self.loop.run_until_complete(SynthWorker.spawn((("cat",), ("/nonexistent/mbrola",))))
+        finally:
+            synth_pool.create_subprocess_exec = create_subprocess_exec
+        self.assertEqual(len(started), 1)
+        self.assertIsNotNone(started[0].returncode)
+
+    def test_pending_limit(self):
+        pool = SynthPool(warm_workers=0, max_voices=1, max_jobs=1, max_pending=1)
+        pool.pending = 1  # a job is already running
+        with self.assertRaises(SynthPoolFull):
+            self.loop.run_until_complete(pool.run(CAT, b"wesh"))
+
+    def test_limits_follow_the_render_scheduler(self):
+        pool = SynthPool(max_jobs=None, max_pending=1)
+        self.assertEqual(pool._jobs_slots._value, render_scheduler.max_renders)
+        self.assertEqual(pool.max_pending, render_scheduler.max_renders)
+
+
+if __name__ == "__main__":
+    unittest.main()
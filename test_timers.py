@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+from time import sleep
+
+from tools.clock import MonotonicClock
+from tools.timers import TimerWheel
+from tools.users import UserState
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(resolution=1, slots=4, levels=3, clock=self.clock, autostart=False)
+        self.fired = []
+
+    def run_until(self, now):
+        """Advances the wheel second by second, recording when the timers fire"""
+        while self.clock.now < now:
+            self.clock.now += 1
+            self.wheel.advance()
+
+    def fire(self, name):
+        self.fired.append((name, self.clock.now - 1000))
+
+    def test_delays(self):
+        # the delays span the three levels, and go beyond the wheel's horizon (64 ticks)
+        for delay in (1, 3, 4, 5, 17, 63, 64, 100, 250):
+            self.wheel.schedule(delay, self.fire, delay)
+        self.run_until(1300)
+        self.assertEqual(self.fired, [(delay, delay) for delay in (1, 3, 4, 5, 17, 63, 64, 100, 250)])
+        self.assertEqual(self.wheel.pending, 0)
+
+    def test_late_advance(self):
+        self.wheel.schedule(10, self.fire, "a")
+        self.wheel.schedule(30, self.fire, "b")
+        self.clock.now += 20
+        self.wheel.advance()
+        self.assertEqual(self.fired, [("a", 20)])
+        self.run_until(1030)
+        self.assertEqual(self.fired, [("a", 20), ("b", 30)])
+
+    def test_schedule_after_idle(self):
+        # the wheel doesn't advance while it's empty, and then doesn't have to go through the idle ticks
+        self.wheel.schedule(1, self.fire, "a")
+        self.run_until(1001)
+        self.clock.now += 1000
+        self.wheel.schedule(5, self.fire, "b")
+        self.assertEqual(self.wheel._tick, 2001)
+        self.clock.now += 5
+        self.wheel.advance()
+        self.assertEqual(self.fired, [("a", 1), ("b", 1006)])
+
+    def test_cancel(self):
+        self.wheel.schedule(5, self.fire, "a").cancel()
+        self.wheel.schedule(6, self.fire, "b")
+        self.run_until(1010)
+        self.assertEqual(self.fired, [("b", 6)])
+        self.assertEqual(self.wheel.pending, 0)
+
+    def test_rescheduling_callback(self):
+        def repeat(count):
+            self.fire(count)
+            if count < 3:
+                self.wheel.schedule(7, repeat, count + 1)
+        self.wheel.schedule(7, repeat, 1)
+        self.run_until(1030)
+        self.assertEqual(self.fired, [(1, 7), (2, 14), (3, 21)])
+
+
+class TestTimedUserState(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(clock=self.clock, autostart=False)
+        self.state = UserState(timers=self.wheel)
+
+    def test_effects_expiry(self):
+        from tools.effects.effects import VowelExchangeEffect, PhonemicEffect
+        short, long = VowelExchangeEffect(), VowelExchangeEffect()
+        short._timeout, long._timeout = 10, 100
+        self.state.add_effect(short)
+        self.state.add_effect(long)
+        self.clock.now += 11
+        self.wheel.advance()
+        self.assertEqual(self.state.effects[PhonemicEffect], [long])
+        self.clock.now += 90
+        self.wheel.advance()
+        self.assertEqual(self.state.effects[PhonemicEffect], [])
+
+    def test_warning_reset(self):
+        self.state.has_been_warned = True
+        self.clock.now += 10 * 60
+        self.wheel.advance()
+        self.assertFalse(self.state.has_been_warned)
+
+
+class TestMonotonicClock(unittest.TestCase):
+
+    def test_cached_per_iteration(self):
+        clock = MonotonicClock()
+
+        async def read_times():
+            first = clock.now()
+            sleep(0.01)
+            second = clock.now()
+            await asyncio.sleep(0)  # the next loop iteration
+            return first, second, clock.now()
+
+        first, second, third = asyncio.run(read_times())
+        self.assertEqual(first, second)
+        self.assertGreater(third, second)
+
+    def test_stopped_loop(self):
+        clock = MonotonicClock()
+        times = []
+
+        def read_time_and_stop(loop):
+            times.append(clock.now())
+            loop.stop()  # before the iteration that would have reset the cached time
+
+        loop = asyncio.new_event_loop()
+        loop.call_soon(read_time_and_stop, loop)
+        loop.run_forever()
+        loop.close()
+        sleep(0.01)
+        self.assertGreater(clock.now(), times[0])  # without a running loop
+
+        async def read_time():
+            return clock.now()
+
+        self.assertGreater(asyncio.run(read_time()), times[0])  # in another loop
+
+
+if __name__ == "__main__":
+    unittest.main()
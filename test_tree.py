@@ -0,0 +1,52 @@
+import unittest
+from os import path
+from tempfile import TemporaryDirectory
+
+from tools.effects.tree import Trie
+
+WORDS = ["manger", "mangeons", "mange", "ranger", "rangeons", "rangé", "a"]
+
+
+class TestTrie(unittest.TestCase):
+
+    def test_lookups(self):
+        trie = Trie.from_words(WORDS)
+        self.assertEqual(len(trie), len(WORDS))
+        self.assertEqual(sorted(trie), sorted(WORDS))
+        for word in WORDS:
+            self.assertIn(word, trie)
+        for word in ("mang", "mangerz", "", "b", "rangée"):
+            self.assertNotIn(word, trie)
+        # the common endings are merged: a plain trie of these words would have 21 nodes
+        self.assertEqual(len(trie.terminals), 14)
+
+    def test_prefixes(self):
+        trie = Trie.from_words(WORDS)
+        self.assertTrue(trie.has_prefix("mang"))
+        self.assertFalse(trie.has_prefix("mo"))
+        self.assertEqual(list(trie.with_prefix("mange")), ["mange", "mangeons", "manger"])
+        self.assertEqual(list(trie.with_prefix("z")), [])
+        with self.assertRaises(ValueError):
+            trie.has_suffix("er")
+
+    def test_suffixes(self):
+        trie = Trie.from_words(WORDS, reverse=True)
+        self.assertIn("rangé", trie)
+        self.assertTrue(trie.has_suffix("geons"))
+        self.assertEqual(sorted(trie.with_suffix("nger")), ["manger", "ranger"])
+        with self.assertRaises(ValueError):
+            trie.with_prefix("man")
+
+    def test_save_load(self):
+        with TemporaryDirectory() as folder:
+            filepath = path.join(folder, "words.dawg")
+            Trie.from_words(WORDS, reverse=True).save(filepath)
+            trie = Trie.load(filepath)
+            self.assertTrue(trie.reverse)
+            self.assertEqual(sorted(trie), sorted(WORDS))
+            self.assertEqual(sorted(trie.with_suffix("eons")), ["mangeons", "rangeons"])
+            self.assertNotIn("rang", trie)
+
+
+if __name__ == "__main__":
+    unittest.main()
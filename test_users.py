@@ -0,0 +1,51 @@
+import unittest
+from os import urandom
+
+from tools.timers import TimerWheel
+from tools.users import IdentityCache, User, UserState
+
+
+class TestIdentityCache(unittest.TestCase):
+
+    def test_identities_are_shared(self):
+        cache = IdentityCache(max_size=2, ttl=3600)
+        cookie_hashes = [urandom(16) for _ in range(3)]
+        identity = cache.get(cookie_hashes[0])
+        self.assertIs(cache.get(cookie_hashes[0]), identity)
+        self.assertEqual(identity.user_id, cookie_hashes[0].hex()[-16:])
+        for cookie_hash in cookie_hashes[1:]:
+            cache.get(cookie_hash)
+        self.assertEqual(cache.stats, {"hits": 1, "misses": 3, "entries": 2})
+        self.assertIsNot(cache.get(cookie_hashes[0]), identity)  # the least recently used was evicted
+
+    def test_expiry(self):
+        cache = IdentityCache(max_size=2, ttl=0)
+        cookie_hash = urandom(16)
+        self.assertIsNot(cache.get(cookie_hash), cache.get(cookie_hash))
+
+    def test_users_voices_are_copies(self):
+        cookie_hash = urandom(16)
+        first_user, second_user = User(cookie_hash, "chan", None), User(cookie_hash, "chan", None)
+        self.assertIs(first_user.info, second_user.info)
+        first_user.voice_params.speed *= 2
+        self.assertNotEqual(first_user.voice_params.speed, second_user.voice_params.speed)
+
+
+class TestUserVoice(unittest.TestCase):
+
+    def test_voice_effects_applied_to_a_copy(self):
+        from tools.effects.effects import VoiceSpeedupEffect, VowelExchangeEffect
+        user = User(urandom(16), "chan", None)
+        user.state = UserState(timers=TimerWheel(autostart=False))
+        speed = user.voice_params.speed
+        user.state.add_effect(VoiceSpeedupEffect(2.0))
+        for _ in range(2):  # the estimate and the render both use the effective voice
+            self.assertEqual(user._effective_voice_params().speed, speed * 2)
+        self.assertEqual(user.voice_params.speed, speed)
+        self.assertTrue(user._calibrates_estimates)
+        user.state.add_effect(VowelExchangeEffect())
+        self.assertFalse(user._calibrates_estimates)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Pool of workers rendering the audio effects out of the event loop, so that a user's reverb doesn't block
+every other connection while it renders. With worker processes, the audio data is passed around through
+shared memory blocks instead of being pickled, while the effects are pickled for each render: the workers
+apply copies of them, so the effects can't keep any state across their renders"""
+import logging
+import random
+from asyncio import get_event_loop, wrap_future, CancelledError
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from pickle import PicklingError
+from secrets import token_hex
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import AUDIO_EFFECTS_EXECUTOR, AUDIO_EFFECTS_WORKERS
+
+logger = logging.getLogger('tools')
+
+# name of the shared memory block, shape and dtype of the array it holds
+SharedArray = Tuple[str, Tuple[int, ...], str]
+
+
+def to_shared_memory(data: np.ndarray, name: str = None) -> SharedArray:
+    """Copies an array to a new shared memory block. It's up to the receiver to unlink that block"""
+    block = SharedMemory(name, create=True, size=max(data.nbytes, 1))
+    shared_data = np.ndarray(data.shape, data.dtype, buffer=block.buf)
+    shared_data[:] = data
+    del shared_data  # the block can't be closed while an array still points to it
+    block.close()
+    return block.name, data.shape, data.dtype.str
+
+
+def from_shared_memory(shared_array: SharedArray, unlink=False) -> np.ndarray:
+    name, shape, dtype = shared_array
+    block = SharedMemory(name)
+    data = np.ndarray(shape, dtype, buffer=block.buf).copy()
+    block.close()
+    if unlink:
+        block.unlink()
+    return data
+
+
+def unlink_shared_memory(name: str):
+    """Unlinks a shared memory block, if it exists"""
+    try:
+        block = SharedMemory(name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def unlink_blocks(shared_array: SharedArray, result_name: str):
+    unlink_shared_memory(shared_array[0])
+    unlink_shared_memory(result_name)
+
+
+def new_block_name() -> str:
+    return "loult_%s" % token_hex(8)
+
+
+def _init_worker():
+    # forked workers all start with the same random state, which would make them pick the same "random" effects
+    random.seed()
+    np.random.seed()
+
+
+def _apply_shared_effects(shared_array: SharedArray, effects: List['AudioEffect'], result_name: str) -> SharedArray:
+    from tools.users import User
+    data = User.apply_effects(from_shared_memory(shared_array), effects)
+    return to_shared_memory(np.asarray(data), result_name)
+
+
+class AudioEffectsPool:
+    """Applies audio effects in a pool of worker processes or threads, or directly in the event loop
+    if there is no executor type"""
+
+    def __init__(self, executor_type: Optional[str] = AUDIO_EFFECTS_EXECUTOR, workers: int = AUDIO_EFFECTS_WORKERS):
+        if executor_type not in ("process", "thread", None):
+            raise ValueError("Unknown audio effects executor type: %s" % executor_type)
+        self.executor_type = executor_type
+        self.workers = workers
+        self._executor = None  # type:Optional[Executor]
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    async def apply(self, data: np.ndarray, effects: List['AudioEffect']) -> np.ndarray:
+        from tools.users import User
+        if self.executor_type is None:
+            return User.apply_effects(data, effects)
+
+        loop = get_event_loop()
+        if self.executor_type == "thread":
+            return await loop.run_in_executor(self.executor, User.apply_effects, data, effects)
+
+        # the result's block is named in advance, so that it can be unlinked even if the worker dies after
+        # creating it
+        shared_array, result_name = to_shared_memory(data), new_block_name()
+        unlink_now = True
+        try:
+            job = self.executor.submit(_apply_shared_effects, shared_array, effects, result_name)
+            result = await wrap_future(job)
+            return from_shared_memory(result)
+        except CancelledError:
+            if not job.done():  # the worker is still running, and would create the result's block afterwards
+                job.add_done_callback(lambda _: unlink_blocks(shared_array, result_name))
+                unlink_now = False
+            raise
+        except (PicklingError, AttributeError, TypeError) as err:
+            logger.warning("Audio effects %s can't be sent to a worker process (%s), applying them in the event loop"
+                           % ([effect.__class__.__name__ for effect in effects], err))
+            return User.apply_effects(data, effects)
+        except BrokenProcessPool:
+            logger.warning("Audio effects worker process died, restarting the pool")
+            self.close()
+            return User.apply_effects(data, effects)
+        finally:
+            if unlink_now:
+                unlink_blocks(shared_array, result_name)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+audio_effects_pool = AudioEffectsPool()
@@ -1,7 +1,8 @@
 from os import listdir, path
 from asyncio import create_subprocess_shell
 from asyncio.subprocess import PIPE
-from typing import List
+from struct import pack_into, unpack_from
+from typing import List, Union, Dict, Tuple
 
 import numpy
 from numpy import pad
@@ -62,13 +63,52 @@ def mix_tracks(track1, track2, offset=None, align=None):
     return padded_short_t + long_t
 
 
+class SampleBank:
+    """Process-wide store of the sound samples used by the effects. Each file is loaded (memory-mapped
+    when possible) only once, the first time it's needed, and is then handed out as a read-only array.
+    The effects' worker processes are forked, so they share the samples that were already loaded. Effects
+    look their samples up when they use them instead of keeping them, so that they stay cheap to pickle"""
+
+    def __init__(self):
+        self._samples = dict()  # type:Dict[str, Tuple[int, numpy.ndarray]]
+        self._folders = dict()  # type:Dict[str, List[str]]
+
+    def get(self, filepath: str) -> Tuple[int, numpy.ndarray]:
+        """Returns the rate and the (read-only) data of a wav file"""
+        return self._get(path.realpath(filepath))
+
+    def _get(self, filepath: str) -> Tuple[int, numpy.ndarray]:
+        if filepath not in self._samples:
+            try:
+                rate, data = read(filepath, mmap=True)
+            except ValueError:  # some wav formats can't be memory-mapped
+                rate, data = read(filepath)
+            data.flags.writeable = False
+            self._samples[filepath] = rate, data
+        return self._samples[filepath]
+
+    def get_folder(self, folder: str) -> List[numpy.ndarray]:
+        """Returns the data of all the wav files in a folder, in a new list"""
+        folder = path.realpath(folder)
+        if folder not in self._folders:
+            self._folders[folder] = sorted(path.join(folder, filename) for filename in listdir(folder))
+        return [self._get(filepath)[1] for filepath in self._folders[folder]]
+
+    @property
+    def size(self):
+        return sum(data.nbytes for _, data in self._samples.values())
+
+    @property
+    def stats(self):
+        return {"samples": len(self._samples), "size": self.size,
+                "mapped": sum(1 for _, data in self._samples.values() if isinstance(data, numpy.memmap))}
+
+
+sample_bank = SampleBank()
+
+
 def get_sounds(dir: str) -> List[numpy.ndarray]:
-    sounds = []
-    for filename in listdir(dir):
-        realpath = path.join(dir, filename)
-        rate, data = read(realpath)
-        sounds.append(data)
-    return sounds
+    return sample_bank.get_folder(dir)
 
 
 async def resample(wave_data : numpy.ndarray, sample_in, sample_out=BASE_SAMPLING_RATE):
@@ -77,3 +117,84 @@ async def resample(wave_data : numpy.ndarray, sample_in, sample_out=BASE_SAMPLIN
     process = await create_subprocess_shell(cmd, stdin=PIPE, stdout=PIPE)
     output, err = await process.communicate(input=wave_data.tobytes(order="f"))
     return numpy.fromstring(output, dtype=numpy.float32)
+
+
+class WavBuffer:
+    """A 16 bits mono wav held in a single buffer. The samples are accessed through a numpy view of that
+    buffer, and the header's fields are patched in place, so that a render goes from mbrola's output to
+    the clients with as few copies as possible."""
+
+    def __init__(self, buffer: Union[bytes, bytearray]):
+        self.buffer = buffer
+        # mbrola's header is the canonical 44 bytes one, but other wavs might hold other chunks before the data
+        data_chunk = buffer.find(b"data", 12, 256)
+        self.data_offset = data_chunk + 8 if data_chunk != -1 else 44
+
+    @classmethod
+    def from_chunks(cls, chunks: List[bytes]) -> 'WavBuffer':
+        """Assembles a streamed render, whose header's size fields aren't set, in a single bytes object. The
+        size fields are set in a copy of the header alone, so that the samples are only copied once"""
+        if len(chunks) == 1 and isinstance(chunks[0], bytes):
+            wav = cls(chunks[0])
+            if wav.has_sizes_set:  # an already assembled wav, such as a cached render
+                return wav
+
+        # the header is within the first 256 bytes, which might be spread over several chunks
+        head = bytearray()
+        for chunk in chunks:
+            head += memoryview(chunk)[:256 - len(head)]
+            if len(head) == 256:
+                break
+        header = cls(head)
+        del head[header.data_offset:]
+        header.set_sizes(sum(len(chunk) for chunk in chunks))
+
+        parts, skipped = [head], len(head)
+        for chunk in chunks:
+            if skipped >= len(chunk):
+                skipped -= len(chunk)
+            else:
+                parts.append(memoryview(chunk)[skipped:] if skipped else chunk)
+                skipped = 0
+        return cls(b"".join(parts))
+
+    @classmethod
+    def from_float32(cls, data: numpy.ndarray, rate: int) -> 'WavBuffer':
+        """Converts float samples (between -1 and 1) to a wav. The data array is used as a scratch
+        buffer, so it's modified"""
+        if data.dtype.kind != 'f' or not data.flags.writeable:
+            data = data.astype(numpy.float32)
+        buffer = bytearray(44 + len(data) * 2)
+        pack_into('<4sI4s4sIHHIIHH4sI', buffer, 0, b"RIFF", len(buffer) - 8, b"WAVE", b"fmt ", 16,
+                  1, 1, rate, rate * 2, 2, 16, b"data", len(buffer) - 44)
+        numpy.multiply(data, 2 ** 15, out=data)
+        numpy.clip(data, -2 ** 15, 2 ** 15 - 1, out=data)
+        numpy.copyto(numpy.frombuffer(buffer, dtype='<i2', offset=44), data, casting='unsafe')
+        return cls(buffer)
+
+    @property
+    def has_sizes_set(self) -> bool:
+        return unpack_from('<I', self.buffer, 4)[0] == len(self.buffer) - 8 and \
+               unpack_from('<I', self.buffer, self.data_offset - 4)[0] == len(self.buffer) - self.data_offset
+
+    def set_sizes(self, size: int = None):
+        """Sets the header's size fields, for a wav of the given size (by default, the buffer's)"""
+        size = len(self.buffer) if size is None else size
+        pack_into('<I', self.buffer, 4, size - 8)
+        pack_into('<I', self.buffer, self.data_offset - 4, size - self.data_offset)
+
+    @property
+    def rate(self) -> int:
+        return unpack_from('<I', self.buffer, 24)[0]
+
+    @property
+    def samples(self) -> numpy.ndarray:
+        """The int16 samples, as a view on the buffer (read-only if the buffer is a bytes object)"""
+        sample_count = (len(self.buffer) - self.data_offset) // 2
+        return numpy.frombuffer(self.buffer, dtype='<i2', count=sample_count, offset=self.data_offset)
+
+    def to_float32(self) -> numpy.ndarray:
+        """Returns the samples as floats between -1 and 1"""
+        data = self.samples.astype(numpy.float32)
+        data *= 2 ** -15
+        return data
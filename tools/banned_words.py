@@ -0,0 +1,189 @@
+"""Matching of the messages against the banned words expressions (config.BANNED_WORDS), with a single matcher
+shared by all the users, which can be reloaded from the configuration while the server runs (on SIGHUP).
+
+The expressions are matched in fullmatch mode. Most of them look for something anywhere in the message
+(".*\\bTrump\\b.*"), which the regex engine does by backtracking over the whole message. These are searched
+for instead, and only when the message contains the literal part of the expression ("trump", looked up
+in the casefolded message for case insensitive expressions), which is much faster than running the regex
+engine on every message. The messages with a line break, which the dots don't match, are still fully matched
+against all the expressions."""
+import importlib
+import logging
+from re import compile as regex, error as RegexError
+from typing import List, Pattern, Tuple
+
+from config import BANNED_WORDS
+
+logger = logging.getLogger('tools')
+
+# a regular expression's leading global flags, such as "(?i)"
+GLOBAL_FLAGS = regex(r"\(\?([aiLmsux]+)\)")
+# a regular expression of the form ".*something.*", and the something
+ANYWHERE = regex(r"\.\*(.*)\.\*")
+QUANTIFIER = regex(r"[?*+]|\{\d*(,\d*)?\}")
+
+
+def scope_flags(pattern: str) -> str:
+    """Restricts the pattern's global flags (if it has some) to the pattern itself"""
+    flags = GLOBAL_FLAGS.match(pattern)
+    if flags is not None:
+        pattern = "(?%s:%s)" % (flags.group(1), pattern[flags.end():])
+    return "(?:%s)" % pattern
+
+
+def combine_patterns(patterns: List[str]) -> List[Pattern]:
+    """Compiles regular expressions into as few as possible, one of which matches a string if one of the
+    expressions does. The expressions with groups are compiled on their own: combining them would renumber
+    their groups, breaking their backreferences, and could give two groups the same name"""
+    compiled = [regex(pattern) for pattern in patterns]
+    plain = [scope_flags(pattern.pattern) for pattern in compiled if not pattern.groups]
+    return ([regex("|".join(plain))] if plain else []) + [pattern for pattern in compiled if pattern.groups]
+
+
+def fold_case(text: str) -> str:
+    # the case insensitive mode of the regex engine matches the turkish dotless i and dotted I with i and I,
+    # which casefolding doesn't do
+    return text.replace("ı", "i").replace("İ", "i").casefold()
+
+
+def _group_end(pattern: str, start: int) -> int:
+    """Index following the end of the group (or characters class) starting at start"""
+    depth, index = 0, start
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            index += 1
+        elif char == "[":
+            index += 1 + (pattern[index + 1:index + 2] == "^")
+            index += pattern[index:index + 1] == "]"  # a leading ] is a character of the class
+            while index < len(pattern) and pattern[index] != "]":
+                index += 1 + (pattern[index] == "\\")
+            if depth == 0:
+                return index + 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return index
+
+
+def required_literal(pattern: str) -> str:
+    """The longest run of literal characters that any match of the pattern contains, or "" if there is none
+    (or if the pattern is too complex to tell). Only the top level of the pattern is looked at."""
+    runs, run, index = [], [], 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            escaped = pattern[index + 1:index + 2]
+            if escaped.isalnum() and escaped not in "bBAZdDwWsS":
+                return ""  # backreferences, and escaped characters (\x41, é...)
+            atom, index = (escaped if not escaped.isalnum() else None), index + 2
+        elif char in "([":
+            atom, index = None, _group_end(pattern, index)
+        elif char in ".^$":
+            atom, index = None, index + 1
+        elif char == "|":
+            return ""
+        else:
+            atom, index = char, index + 1
+
+        quantifier = QUANTIFIER.match(pattern, index)
+        if quantifier is not None:
+            index = quantifier.end()
+            if pattern[index:index + 1] in ("?", "+"):  # lazy or possessive quantifier
+                index += 1
+            if atom is not None and quantifier.group(0) == "+":  # the character is there, but can be repeated
+                run.append(atom)
+            atom = None
+        if atom is None:
+            runs.append("".join(run))
+            run = []
+        else:
+            run.append(atom)
+    runs.append("".join(run))
+    return max(runs, key=len)
+
+
+class BannedWordsMatcher:
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = []  # type:List[str]
+        # the "something" of the ".*something.*" expressions, with its literal part (casefolded if the
+        # expression is case insensitive), and whether it's case insensitive
+        self._prefiltered = []  # type:List[Tuple[str, bool, Pattern]]
+        # those that have no literal part, the other expressions, and all of them for the messages with a
+        # line break (each compiled in as few patterns as possible, see combine_patterns)
+        self._searched = []  # type:List[Pattern]
+        self._fullmatched = []  # type:List[Pattern]
+        self._multiline = []  # type:List[Pattern]
+        self.load(patterns)
+
+    def load(self, patterns: List[str]):
+        """Compiles the expressions, raising re.error (and keeping the former ones) if one of them is invalid"""
+        prefiltered, searched, fullmatched = [], [], []
+        for pattern in patterns:
+            flags = GLOBAL_FLAGS.match(pattern)
+            flags_letters = flags.group(1) if flags is not None else ""
+            anywhere = ANYWHERE.fullmatch(pattern, flags.end() if flags is not None else 0)
+            if anywhere is not None and self._is_searchable(anywhere.group(1), flags_letters):
+                searched_pattern = (flags.group(0) if flags is not None else "") + anywhere.group(1)
+                literal = required_literal(anywhere.group(1))
+                if literal:
+                    ignore_case = "i" in flags_letters
+                    prefiltered.append((fold_case(literal) if ignore_case else literal, ignore_case,
+                                        regex(searched_pattern)))
+                else:
+                    searched.append(searched_pattern)
+            else:
+                fullmatched.append(pattern)
+        multiline = combine_patterns(patterns)
+        self._searched, self._fullmatched = combine_patterns(searched), combine_patterns(fullmatched)
+        self._prefiltered, self._multiline = prefiltered, multiline
+        self.patterns = list(patterns)
+
+    @staticmethod
+    def _is_searchable(pattern: str, flags: str) -> bool:
+        """Whether searching for the pattern is the same as fully matching .*pattern.* : it mustn't be an
+        alternation (".*a|b.*" is "(.*a)|(b.*)"), nor a part of two expressions (".*a).*(b.*"), and the
+        flags mustn't change how the dots match"""
+        if "|" in pattern or set(flags) & set("msx"):
+            return False
+        try:
+            regex(pattern)
+            return True
+        except RegexError:
+            return False
+
+    def reload(self):
+        """Loads the banned words expressions from the configuration again"""
+        import config
+        try:
+            self.load(importlib.reload(config).BANNED_WORDS)
+            logger.info("Reloaded %d banned words expressions" % len(self.patterns))
+        except (RegexError, SyntaxError) as err:
+            logger.warning("Couldn't reload the banned words, keeping the former ones: %s" % err)
+
+    def matches(self, msg: str) -> bool:
+        # in ".*something.*", the dots don't match line breaks, but the something may: a message with one
+        # only matches if the something's match goes from its first line to its last one
+        if "\n" in msg:
+            return any(pattern.fullmatch(msg) is not None for pattern in self._multiline)
+        folded_msg = None
+        for literal, ignore_case, searched in self._prefiltered:
+            if ignore_case:
+                folded_msg = fold_case(msg) if folded_msg is None else folded_msg
+                if literal not in folded_msg:
+                    continue
+            elif literal not in msg:
+                continue
+            if searched.search(msg) is not None:
+                return True
+        if any(searched.search(msg) is not None for searched in self._searched):
+            return True
+        return any(pattern.fullmatch(msg) is not None for pattern in self._fullmatched)
+
+
+banned_words = BannedWordsMatcher(BANNED_WORDS)
@@ -0,0 +1,122 @@
+"""Caches for the rendered messages, since the same short messages tend to be rendered over and over.
+There is one cache for each rendering stage, so they can be measured independently"""
+import logging
+from asyncio import get_event_loop
+from collections import OrderedDict
+from hashlib import sha1
+from os import path, makedirs, replace
+from secrets import token_hex
+from typing import Optional
+
+from config import RENDER_CACHE_SIZE, RENDER_CACHE_MAX_ITEM_SIZE, RENDER_CACHE_DIR, PHONEMES_CACHE_SIZE, \
+    MBROLA_CACHE_SIZE
+
+logger = logging.getLogger('tools')
+
+
+class RenderCache:
+    """LRU cache of renders (audio or phonemes), bounded by the total size (in bytes) of the cached renders.
+    If a folder is given, renders are also written to (and looked up in) that folder, so they outlive the
+    in-memory cache and the server's restarts. The files are read and written in the event loop's default
+    executor by load and save, so a slow disk doesn't block the loop: get and put only use the memory."""
+
+    def __init__(self, max_size: int, max_item_size: int, disk_dir: str = None):
+        self.max_size = max_size
+        self.max_item_size = max_item_size
+        self.disk_dir = disk_dir
+        self.size = 0
+        self.hits, self.disk_hits, self.misses = 0, 0, 0
+        self._entries = OrderedDict()  # type:OrderedDict[str, bytes]
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return path.join(self.disk_dir, key[:2], key)
+
+    def _store(self, key: str, value: bytes):
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _memory_hit(self, key: str) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Looks up a render in memory"""
+        value = self._memory_hit(key)
+        if value is None:
+            self.misses += 1
+        return value
+
+    async def load(self, key: str) -> Optional[bytes]:
+        """Looks up a render in memory, then in the disk folder (if there is one)"""
+        value = self._memory_hit(key)
+        if value is not None:
+            return value
+
+        if self.disk_dir is not None:
+            value = await get_event_loop().run_in_executor(None, self._read_file, key)
+            if value is not None:
+                if key not in self._entries:  # it may have been stored while the file was read
+                    self._store(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def _read_file(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as cached_file:
+                return cached_file.read()
+        except FileNotFoundError:
+            return None
+
+    def peek(self, key: str) -> Optional[bytes]:
+        """Looks up a render in memory only, without counting it as a use of the render"""
+        return self._entries.get(key)
+
+    def put(self, key: str, value: bytes) -> bool:
+        """Stores a render in memory, returning whether it was stored (and not already there)"""
+        if not value or len(value) > self.max_item_size or key in self._entries:
+            return False
+        self._store(key, value)
+        return True
+
+    async def save(self, key: str, value: bytes):
+        """Stores a render in memory, and writes it to the disk folder (if there is one)"""
+        if self.put(key, value) and self.disk_dir is not None:
+            await get_event_loop().run_in_executor(None, self._write_file, key, value)
+
+    def _write_file(self, key: str, value: bytes):
+        filepath = self._disk_path(key)
+        # writing to a temporary file first, so a concurrent reader never gets a truncated file
+        temp_filepath = "%s.%s.tmp" % (filepath, token_hex(4))
+        try:
+            makedirs(path.dirname(filepath), exist_ok=True)
+            with open(temp_filepath, "wb") as cached_file:
+                cached_file.write(value)
+            replace(temp_filepath, filepath)
+        except OSError as err:
+            logger.warning("Couldn't write render to the disk cache: %s" % err)
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "entries": len(self._entries), "size": self.size}
+
+
+# text -> audio renders, the whole espeak + mbrola pipeline
+render_cache = RenderCache(RENDER_CACHE_SIZE, RENDER_CACHE_MAX_ITEM_SIZE, RENDER_CACHE_DIR)
+# text -> phonemes renders (espeak)
+phonemes_cache = RenderCache(PHONEMES_CACHE_SIZE, RENDER_CACHE_MAX_ITEM_SIZE)
+# phonemes -> audio renders (mbrola)
+mbrola_cache = RenderCache(MBROLA_CACHE_SIZE, RENDER_CACHE_MAX_ITEM_SIZE)
@@ -0,0 +1,33 @@
+"""The server's time base for its delays and rate limits: monotonic time, in float seconds, which doesn't
+jump with the wall clock, and is cheaper to get and compare than datetime objects. The wall clock is only
+used for the dates shown to the users.
+
+Within an iteration of the event loop, the time is read once, then cached until the next iteration: the
+messages handled together get the same time, and reading it again is only an attribute lookup. The cached
+time is only used by the loop that cached it, since a loop might have stopped (or been closed) before
+getting to the next iteration, and it's never used outside of a running loop."""
+from asyncio import get_running_loop
+from time import monotonic
+
+
+class MonotonicClock:
+
+    def __init__(self):
+        self._now = None  # the cached time, reset at the next loop iteration
+        self._loop = None  # the loop that cached it
+
+    def now(self) -> float:
+        try:
+            loop = get_running_loop()
+        except RuntimeError:  # no loop to tell when the time is out of date, so it isn't cached
+            return monotonic()
+        if self._now is None or self._loop is not loop:
+            self._now, self._loop = monotonic(), loop
+            loop.call_soon(self._expire)
+        return self._now
+
+    def _expire(self):
+        self._now = None
+
+
+clock = MonotonicClock()
@@ -0,0 +1,218 @@
+"""In-process implementations (numpy/scipy) of the sox effects used by the audio effects. DSPChain has the
+same interface as pysndfx's AudioEffectsChain, and its effects take the same parameters as their sox
+counterparts, but the audio never leaves the python process.
+
+The recursive filters (reverb combs and allpasses) are run in blocks as long as their delay line, which
+makes each block a vectorized operation on the previous one."""
+from fractions import Fraction
+from typing import List, Union
+
+import numpy as np
+from scipy.signal import lfilter, firwin, kaiserord, fftconvolve, resample_poly
+
+# sizes of the reverb's comb and allpass filters (in samples at 44.1kHz) from freeverb, like in sox
+REVERB_COMBS = (1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617)
+REVERB_ALLPASSES = (225, 341, 441, 556)
+
+
+def db_to_linear(db: float) -> float:
+    return 10 ** (db / 20)
+
+
+def parse_frequency(frequency: Union[int, float, str]) -> float:
+    """sox frequencies can be given in kHz, such as '3.5k'"""
+    if isinstance(frequency, str) and frequency.endswith("k"):
+        return float(frequency[:-1]) * 1000
+    return float(frequency)
+
+
+def resample(data: np.ndarray, ratio: float) -> np.ndarray:
+    """Resamples the data so that its length is multiplied by ratio"""
+    ratio = Fraction(ratio).limit_denominator(100)
+    return resample_poly(data, ratio.numerator, ratio.denominator)
+
+
+def _comb(data: np.ndarray, delay: int, feedback: float, damping: float) -> np.ndarray:
+    """Freeverb's lowpass-feedback comb filter. Each block of output is the previous block of input,
+    plus the lowpassed previous block of output, hence the processing in blocks of the delay's size"""
+    blocks_count = -(-len(data) // delay)
+    padded = np.zeros(blocks_count * delay)
+    padded[:len(data)] = data
+    output = np.zeros((blocks_count + 1) * delay)
+    lowpass_state = np.zeros(1)
+    for start in range(delay, len(output), delay):
+        previous_output = output[start - delay:start]
+        lowpassed, lowpass_state = lfilter([1 - damping], [1, -damping], previous_output, zi=lowpass_state)
+        output[start:start + delay] = padded[start - delay:start] + feedback * lowpassed
+    return output[:len(data)]
+
+
+def _allpass(data: np.ndarray, delay: int) -> np.ndarray:
+    """Freeverb's allpass filter, also processed in blocks of the delay's size"""
+    buffer = np.zeros(len(data) + delay)
+    for start in range(0, len(data), delay):
+        block = data[start:start + delay]
+        buffer[start + delay:start + delay + len(block)] = block + 0.5 * buffer[start:start + len(block)]
+    return buffer[:len(data)] - data
+
+
+def reverb(data: np.ndarray, rate: int, reverberance=50, hf_damping=50, room_scale=100, stereo_depth=100,
+           pre_delay=20, wet_gain=0, wet_only=False) -> np.ndarray:
+    """Freeverb, with the same parameters (and the same mapping of these parameters) as sox's reverb.
+    The input is mono, so the stereo depth doesn't matter"""
+    # these are sox's mappings from its parameters to freeverb's
+    scale = room_scale / 100 * .9 + .1
+    min_feedback_factor = -1 / np.log(1 - .3)
+    max_feedback_factor = 100 / (np.log(1 - .98) * min_feedback_factor + 1)
+    feedback = 1 - np.exp((reverberance - max_feedback_factor) / (min_feedback_factor * max_feedback_factor))
+    damping = hf_damping / 100 * .3 + .2
+    wet_input = np.concatenate([np.zeros(int(pre_delay / 1000 * rate + .5)), data])[:len(data)]
+    wet_input = wet_input * db_to_linear(wet_gain) * .015
+
+    wet = sum(_comb(wet_input, max(1, int(scale * rate / 44100 * size + .5)), feedback, damping)
+              for size in REVERB_COMBS)
+    for size in REVERB_ALLPASSES:
+        wet = _allpass(wet, max(1, int(rate / 44100 * size + .5)))
+    return wet if wet_only else data + wet
+
+
+def tempo(data: np.ndarray, rate: int, factor: float, segment=82, search=14.68, overlap=12) -> np.ndarray:
+    """Changes the tempo of the audio without changing its pitch, using WSOLA like sox's tempo: the
+    audio is cut in segments (of segment ms), each of them taken in a window (of search ms) around its
+    nominal position, where it best matches the end of the previous segment, and crossfaded with it
+    (on overlap ms)."""
+    segment, search, overlap = (int(rate * duration / 1000) for duration in (segment, search, overlap))
+    output_step = segment - overlap
+    output_length = int(len(data) / factor)
+    padded = np.concatenate([np.zeros(search), data, np.zeros(segment + 2 * search)])
+    output = np.zeros(output_length + segment)
+    fade_in = np.linspace(0, 1, overlap, endpoint=False)
+
+    for output_pos in range(0, output_length, output_step):
+        input_pos = int(output_pos * factor)  # position of the segment in the input, before the search
+        if output_pos == 0:
+            output[:segment] = padded[search:search + segment]
+            continue
+        previous_tail = output[output_pos:output_pos + overlap]
+        candidates = padded[input_pos:input_pos + 2 * search + overlap]
+        offset = input_pos + np.argmax(np.correlate(candidates, previous_tail, mode='valid'))
+        chosen = padded[offset:offset + segment]
+        output[output_pos:output_pos + overlap] = previous_tail * (1 - fade_in) + chosen[:overlap] * fade_in
+        output[output_pos + overlap:output_pos + segment] = chosen[overlap:]
+
+    return output[:output_length]
+
+
+def pitch(data: np.ndarray, rate: int, shift: float, use_tree=False, segment=82, search=14.68,
+          overlap=12) -> np.ndarray:
+    """Shifts the pitch (by shift cents) without changing the tempo, like sox: the audio is
+    stretched then resampled back to its original length"""
+    ratio = 2 ** (shift / 1200)
+    stretched = tempo(data, rate, 1 / ratio, segment, search, overlap)
+    repitched = resample(stretched, 1 / ratio)
+    return np.pad(repitched, (0, max(0, len(data) - len(repitched))))[:len(data)]
+
+
+def tremolo(data: np.ndarray, rate: int, freq: float, depth=40) -> np.ndarray:
+    """Sine amplitude modulation, the gain going from 1 - depth% to 1"""
+    depth = depth / 100
+    modulation = np.sin(2 * np.pi * freq * np.arange(len(data)) / rate)
+    return data * (1 - depth / 2 + depth / 2 * modulation)
+
+
+def delay(data: np.ndarray, rate: int, gain_in=0.8, gain_out=0.5, delays=(1000, 1800), decays=(0.3, 0.25),
+          parallel=False) -> np.ndarray:
+    """Echoes (delays are in ms), like sox's echo, or like sox's echos (each echo echoing the
+    previous ones) if parallel is set, which is how pysndfx maps it"""
+    delays = [int(rate * delay_ms / 1000) for delay_ms in delays]
+    output = np.zeros(len(data) + max(delays))
+    output[:len(data)] = data * gain_in
+    if parallel:
+        for delay_samples, decay in zip(delays, decays):
+            echoed = output[:len(output) - delay_samples].copy()
+            output[delay_samples:] += echoed * decay
+    else:
+        for delay_samples, decay in zip(delays, decays):
+            output[delay_samples:delay_samples + len(data)] += data * decay
+    return output * gain_out
+
+
+def sinc(data: np.ndarray, rate: int, high_pass_frequency=None, low_pass_frequency=None,
+         attenuation=120, **kwargs) -> np.ndarray:
+    """Linear phase FIR band-pass (or high-pass, or low-pass) filter, with a Kaiser window"""
+    nyquist = rate / 2
+    high_pass = parse_frequency(high_pass_frequency) if high_pass_frequency is not None else None
+    low_pass = parse_frequency(low_pass_frequency) if low_pass_frequency is not None else None
+    if low_pass is not None and low_pass >= nyquist:
+        low_pass = None
+    if high_pass is None and low_pass is None:
+        return data
+
+    # sox's default transition band is 5% of the passband's frequency
+    transition = 0.05 * min(freq for freq in (high_pass, low_pass) if freq is not None)
+    numtaps, beta = kaiserord(attenuation, transition / nyquist)
+    numtaps |= 1  # odd, for the filter to have an integer delay (and to allow high-passes)
+    if high_pass is not None and low_pass is not None:
+        cutoff, pass_zero = [high_pass, low_pass], False
+    elif high_pass is not None:
+        cutoff, pass_zero = high_pass, False
+    else:
+        cutoff, pass_zero = low_pass, True
+    taps = firwin(numtaps, cutoff, window=('kaiser', beta), pass_zero=pass_zero, fs=rate)
+    return fftconvolve(data, taps, mode='same')
+
+
+def overdrive(data: np.ndarray, rate: int, gain=20, colour=20) -> np.ndarray:
+    """Cubic soft clipping, followed by a DC blocker, mixed with the dry signal like in sox"""
+    driven = data * db_to_linear(gain) + colour / 200
+    clipped = np.where(driven < -1, -2 / 3, np.where(driven > 1, 2 / 3, driven - driven ** 3 / 3))
+    return data * .5 + lfilter([1, -1], [1, -.995], clipped) * .75
+
+
+def gain(data: np.ndarray, rate: int, db: float) -> np.ndarray:
+    return data * db_to_linear(db)
+
+
+class DSPChain:
+    """Drop-in replacement for pysndfx's AudioEffectsChain (for mono numpy arrays), rendering the effects
+    in-process. Like in sox, the audio is clipped between each effect."""
+
+    def __init__(self):
+        self.effects = []  # type:List
+
+    def _append(self, effect, **params):
+        self.effects.append((effect, params))
+        return self
+
+    def reverb(self, reverberance=50, hf_damping=50, room_scale=100, stereo_depth=100, pre_delay=20, wet_gain=0,
+               wet_only=False):
+        return self._append(reverb, reverberance=reverberance, hf_damping=hf_damping, room_scale=room_scale,
+                            stereo_depth=stereo_depth, pre_delay=pre_delay, wet_gain=wet_gain, wet_only=wet_only)
+
+    def pitch(self, shift, use_tree=False, segment=82, search=14.68, overlap=12):
+        return self._append(pitch, shift=shift, use_tree=use_tree, segment=segment, search=search, overlap=overlap)
+
+    def tremolo(self, freq, depth=40):
+        return self._append(tremolo, freq=freq, depth=depth)
+
+    def delay(self, gain_in=0.8, gain_out=0.5, delays=list((1000, 1800)), decays=list((0.3, 0.25)), parallel=False):
+        return self._append(delay, gain_in=gain_in, gain_out=gain_out, delays=delays, decays=decays,
+                            parallel=parallel)
+
+    def sinc(self, high_pass_frequency=None, low_pass_frequency=None, **kwargs):
+        return self._append(sinc, high_pass_frequency=high_pass_frequency, low_pass_frequency=low_pass_frequency,
+                            **kwargs)
+
+    def overdrive(self, gain=20, colour=20):
+        return self._append(overdrive, gain=gain, colour=colour)
+
+    def gain(self, db):
+        return self._append(gain, db=db)
+
+    def __call__(self, src: np.ndarray, sample_in=44100, sample_out=None) -> np.ndarray:
+        data = np.clip(src.astype(np.float64), -1, 1)
+        for effect, params in self.effects:
+            data = np.clip(effect(data, sample_in, **params), -1, 1)
+        if sample_out is not None and sample_out != sample_in:
+            data = resample(data, sample_out / sample_in)
+        return data.astype(src.dtype)
@@ -1,7 +1,5 @@
 import json
-import pickle
 import random
-from datetime import datetime
 from functools import partial
 from itertools import cycle
 from os import path
@@ -10,11 +8,13 @@ from statistics import mean
 
 import numpy as np
 from pysndfx import AudioEffectsChain
-from scipy.io.wavfile import read
+
+from tools.clock import clock
 
 import tools
-from tools.audio_tools import mix_tracks, get_sounds, BASE_SAMPLING_RATE
-from tools.effects.tree import Node, Leaf
+from tools.audio_tools import mix_tracks, get_sounds, BASE_SAMPLING_RATE, sample_bank
+from tools.effects.dsp import DSPChain
+from tools.lexicon import rhymes_lexicon, verbs_lexicon
 from tools.phonems import PhonemList, Phonem, FrenchPhonems
 from tools.users import VoiceParameters
 from .melody import chord_progressions, get_harmonies
@@ -27,9 +27,11 @@ from .melody import chord_progressions, get_harmonies
 class Effect:
     NAME = ""
     TIMEOUT = 0
+    # an effect is deterministic if it always gives the same output for the same input
+    DETERMINISTIC = False
 
     def __init__(self):
-        self.creation = datetime.now()
+        self.creation = clock.now()
         self._timeout = None
 
     @property
@@ -40,8 +42,13 @@ class Effect:
     def name(self):
         return self.NAME # using a property, in case it gets more fancy than just a class constant
 
+    @property
+    def fingerprint(self):
+        """Identifies what a deterministic effect does, used to cache renders using this effect"""
+        return self.__class__.__name__
+
     def is_expired(self):
-        return (datetime.now() - self.creation).seconds > self.timeout
+        return clock.now() - self.creation > self.timeout
 
     def process(self, **kwargs):
         pass
@@ -95,7 +102,16 @@ class VoiceEffect(Effect):
 
 
 class AudioEffect(Effect):
-    """Modifies the audio file, after the mbrola rendering"""
+    """Modifies the audio file, after the mbrola rendering.
+
+    The effects are applied in worker processes (see tools.audio_pool), to copies of themselves: process()
+    mustn't change the effect's state, since the change would be lost once the copy has been used"""
+    # effects chains are either rendered in-process ("numpy", see tools/effects/dsp.py), or by sox ("sox")
+    DSP_BACKEND = "numpy"
+
+    def effects_chain(self):
+        """Returns a new effects chain, rendered by the effect's DSP backend"""
+        return DSPChain() if self.DSP_BACKEND == "numpy" else AudioEffectsChain()
 
     def process(self, wave_data: np.ndarray) -> np.ndarray:
         pass
@@ -142,29 +158,21 @@ class PoiloEffect(ExplicitTextEffect):
     NAME = "poil au snèbwèw"
     TIMEOUT = 180
 
-    tree_pickle = path.join(path.dirname(path.realpath(__file__)),
-                            "data/pwezie/rhyme_tree.pckl")
-
     article_mapping = {("m", "s") : "au",
                        ("m", "p") : "aux",
                        ("f", "s") : "à la",
                        ("f", "p") : "aux"}
 
-    def __init__(self):
-        super().__init__()
-        with open(self.tree_pickle, "rb") as pkfile:
-            self.rtree = pickle.load(pkfile)
-
     def process(self, text : str):
         splitted = text.strip("?! ,:").split()
         if splitted:
-            rhyme = self.rtree.find_rhyme(splitted[-1])
+            rhyme = rhymes_lexicon.find_rhyme(splitted[-1])
             if rhyme is not None:
                 if splitted[-1][0] in ["aoeiuyéèê"]:
                     article = "à l'"
                 else:
                     try:
-                        article = self.article_mapping[(rhyme.data["genre"], rhyme.data["nombre"])]
+                        article = self.article_mapping[(rhyme.genre, rhyme.nombre)]
                     except KeyError:
                         article = "au"
                 return text + " poil %s %s" % (article, rhyme.text)
@@ -175,12 +183,6 @@ class PoiloEffect(ExplicitTextEffect):
 class ContradictorEffect(ExplicitTextEffect):
     NAME = "contradicteur"
     TIMEOUT = 600
-    TREE_FILEPATH = path.join(path.dirname(path.realpath(__file__)), "data/contradicteur/verbs_tree.pckl")
-
-    def __init__(self):
-        super().__init__()
-        with open(self.TREE_FILEPATH, "rb") as treefile:
-            self.verb_tree = pickle.load(treefile) # type:Node
 
     def process(self, text : str):
         if random.randint(1, 2) == 1:
@@ -192,7 +194,7 @@ class ContradictorEffect(ExplicitTextEffect):
                     previous_was_negation = True
                 else:
                     reconstructed += word + " "
-                    if previous_was_negation and self.verb_tree.has_leaf(Leaf(word)): # testing if it's a verb
+                    if previous_was_negation and word in verbs_lexicon: # testing if it's a verb
                         reconstructed += 'pas'
                         previous_was_negation = False
 
@@ -268,6 +270,7 @@ class PhonemicNwwoiwwEffect(PhonemicEffect):
 class PhonemicFofoteEffect(PhonemicEffect):
     NAME = "fofotage"
     TIMEOUT = 150
+    DETERMINISTIC = True
 
     def process(self, phonems : PhonemList):
         for phonem in phonems:
@@ -298,6 +301,7 @@ class AccentAllemandEffect(PhonemicEffect):
 class AccentMarseillaisEffect(PhonemicEffect):
     NAME = "du vieux port"
     TIMEOUT = 150
+    DETERMINISTIC = True
 
     def process(self, phonems: PhonemList):
         reconstructed = PhonemList([])
@@ -564,7 +568,7 @@ class ReverbManEffect(AudioEffect):
 
     def process(self, wave_data: np.ndarray):
         wave_data = np.concatenate([wave_data, np.zeros(BASE_SAMPLING_RATE, wave_data.dtype)])
-        apply_audio_effects = AudioEffectsChain().reverb(reverberance=100, hf_damping=100)
+        apply_audio_effects = self.effects_chain().reverb(reverberance=100, hf_damping=100)
         return apply_audio_effects(wave_data, sample_in=BASE_SAMPLING_RATE, sample_out=BASE_SAMPLING_RATE)
 
 
@@ -575,6 +579,7 @@ class GhostEffect(AudioEffect):
 
     def process(self, wave_data: np.ndarray):
         reverb = ReverbManEffect()
+        reverb.DSP_BACKEND = self.DSP_BACKEND
         return reverb.process(wave_data[::-1])[::-1]
 
 
@@ -583,7 +588,7 @@ class RobotVoiceEffect(AudioEffect):
     TIMEOUT = 150
 
     def process(self, wave_data: np.ndarray):
-        apply_audio_effects = AudioEffectsChain().pitch(200).tremolo(500).delay(0.6, 0.8, [33],[0.9])
+        apply_audio_effects = self.effects_chain().pitch(200).tremolo(500).delay(0.6, 0.8, [33],[0.9])
         return apply_audio_effects(wave_data, sample_in=BASE_SAMPLING_RATE, sample_out=BASE_SAMPLING_RATE)
 
 
@@ -595,11 +600,11 @@ class AngryRobotVoiceEffect(AudioEffect):
 
     def process(self, wave_data: np.ndarray):
         # making a partial for each pitch change
-        effects_partials = [partial(AudioEffectsChain().pitch(pitch),
+        effects_partials = [partial(self.effects_chain().pitch(pitch),
                                     sample_in=BASE_SAMPLING_RATE, sample_out=BASE_SAMPLING_RATE)
                             for pitch in [200, 100, -100, -200]]
         # preparing a reverb effect chain
-        reverb = AudioEffectsChain().reverb(reverberance=50, hf_damping=100).gain(-5)
+        reverb = self.effects_chain().reverb(reverberance=50, hf_damping=100).gain(-5)
         # sometimes, the pitch_shifted output arrays are slightly different from one another,
         # thus, to sum them we need to find the minimal length
         repitched_arrays = [effect(wave_data) for effect in effects_partials]
@@ -621,7 +626,7 @@ class PitchShiftEffect(AudioEffect):
             self._name, self.pitch_shift = "castration", 700
 
     def process(self, wave_data: np.ndarray):
-        pitch_shift = AudioEffectsChain().pitch(self.pitch_shift)
+        pitch_shift = self.effects_chain().pitch(self.pitch_shift)
         return pitch_shift(wave_data, sample_in=BASE_SAMPLING_RATE, sample_out=BASE_SAMPLING_RATE)
 
 
@@ -635,7 +640,10 @@ class WpseEffect(AudioEffect):
     def __init__(self):
         super().__init__()
         self.type_folder = random.choice(self.subfolders)
-        self.samples = get_sounds(path.join(self.main_dir, self.type_folder))
+
+    @property
+    def samples(self):
+        return get_sounds(path.join(self.main_dir, self.type_folder))
 
     def process(self, wave_data: np.ndarray):
         if random.randint(1,2) == 1:
@@ -662,8 +670,10 @@ class BadCellphoneEffect(AudioEffect):
         self.signal = signal_strength if signal_strength is not None else random.randint(1, 3)
         self._name = "%i barres de rézo" % self.signal
         self.hpfreq, self.lpfreq, self.overdrive, self.gain = self._params_table[self.signal]
-        with open(self._interference_filepath, "rb") as sndfile:
-            rate, self.interf_fx = read(sndfile)
+
+    @property
+    def interf_fx(self):
+        return sample_bank.get(self._interference_filepath)[1]
 
     @property
     def name(self):
@@ -690,7 +700,7 @@ class BadCellphoneEffect(AudioEffect):
 
     def process(self, wave_data: np.ndarray):
         # first, giving the
-        chain = AudioEffectsChain() \
+        chain = self.effects_chain() \
             .sinc(high_pass_frequency=self.hpfreq, low_pass_frequency=self.lpfreq) \
             .overdrive(self.overdrive) \
             .gain(self.gain)
@@ -780,10 +790,13 @@ class GodSpeakingEffect(EffectGroup):
                                 "data/godspeaking/godspeaking.wav")
         _gain = 0.4
 
-        def __init__(self):
-            super().__init__()
-            with open(self._sound_file, "rb") as sndfile:
-                self.rate, self.track_data = read(sndfile)
+        @property
+        def rate(self):
+            return sample_bank.get(self._sound_file)[0]
+
+        @property
+        def track_data(self):
+            return sample_bank.get(self._sound_file)[1]
 
         def process(self, wave_data: np.ndarray):
             padding_time = self.rate * 2
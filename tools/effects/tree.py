@@ -1,58 +1,150 @@
-from typing import Dict, Union
+"""A compact, read-only trie of words, minimized into a DAWG (the nodes whose subtrees are the same are merged,
+so the words' common endings, like the conjugations of the verbs, are only stored once).
 
-class Leaf:
+The nodes are held in flat arrays: node i's edges are the indexes from edges_start[i] to edges_start[i + 1]
+of the labels (the characters' code points, sorted) and targets arrays, so a lookup is a binary search per
+character, which doesn't allocate anything. The arrays can be saved to a file, which is then memory-mapped
+instead of being read."""
+from array import array
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from typing import Iterable, Iterator, List, Dict, Tuple, Sequence
 
-    def __init__(self, word : str):
-        self.str = word
+TRIE_HEADER = Struct("<4sIIII")  # magic, reversed, nodes count, edges count, words count
+TRIE_MAGIC = b"DWG1"
 
-    def pop_first(self):
-        if self.str:
-            out = self.str[0]
-            self.str = self.str[1:]
-            return out
-        else:
-            raise IndexError()
 
-    def has_leaf(self, leaf):
-        return True
+class Trie:
+    """A reversed trie holds its words from their end, which makes it answer suffix queries instead of
+    prefix queries"""
 
-    @property
-    def isnull(self):
-        return not self.str
-
-class Node:
-
-    def __init__(self):
-        self.children = dict() # type:Dict[Union[Node, Leaf]]
-        self.isleaf = False
-
-    def add_leaf(self, leaf : Leaf):
-        try:
-            leaf_first_letter = leaf.pop_first()
-            if leaf_first_letter in self.children:
-                child = self.children[leaf_first_letter]
-                if isinstance(child, Leaf):
-                    new_child = Node()
-                    self.children[leaf_first_letter] = new_child
-                    new_child.add_leaf(child)
-                    new_child.add_leaf(leaf)
-                elif isinstance(child, Node):
-                    child.add_leaf(leaf)
-
-            else:
-                self.children[leaf_first_letter] = leaf
-        except IndexError:
-            self.isleaf = True
-
-    def has_leaf(self, leaf : Leaf) -> bool:
-        if leaf.isnull:
-            return self.isleaf
-        else:
-            leaf_first_letter = leaf.pop_first()
-            if leaf_first_letter in self.children:
-                return self.children[leaf_first_letter].has_leaf(leaf)
-            else:
-                return False
+    def __init__(self, edges_start: Sequence[int], labels: Sequence[int], targets: Sequence[int],
+                 terminals: Sequence[int], words_count: int, reverse=False):
+        self.edges_start = edges_start
+        self.labels = labels
+        self.targets = targets
+        self.terminals = terminals
+        self.words_count = words_count
+        self.reverse = reverse
+        self.root = len(terminals) - 1
+
+    @classmethod
+    def from_words(cls, words: Iterable[str], reverse=False) -> 'Trie':
+        children = [dict()]  # type:List[Dict[int, int]]
+        terminals = [False]
+        for word in words:
+            node = 0
+            for char in (reversed(word) if reverse else word):
+                child = children[node].get(ord(char))
+                if child is None:
+                    child = children[node][ord(char)] = len(children)
+                    children.append(dict())
+                    terminals.append(False)
+                node = child
+            terminals[node] = True
+
+        # the nodes are numbered in post-order, each one being merged with the already numbered node
+        # that has the same subtree, if there's one. The root is then the last node.
+        register = dict()  # type:Dict[Tuple, int]
+        canonical = [0] * len(children)
+        stack = [(0, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children[node].values())
+                continue
+            signature = (terminals[node],
+                         tuple(sorted((label, canonical[child]) for label, child in children[node].items())))
+            canonical[node] = register.setdefault(signature, len(register))
+
+        edges_start, labels, targets, final = array("I", [0]), array("I"), array("I"), array("B")
+        for is_terminal, edges in register:  # dicts are ordered, so the signatures come by node number
+            for label, target in edges:
+                labels.append(label)
+                targets.append(target)
+            edges_start.append(len(labels))
+            final.append(is_terminal)
+        return cls(edges_start, labels, targets, final, sum(terminals), reverse)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'Trie':
+        """Memory-maps a saved trie"""
+        with open(filepath, "rb") as trie_file:
+            trie_map = mmap(trie_file.fileno(), 0, access=ACCESS_READ)
+        magic, reverse, nodes_count, edges_count, words_count = TRIE_HEADER.unpack_from(trie_map)
+        if magic != TRIE_MAGIC:
+            raise ValueError("%s isn't a saved trie" % filepath)
+        view, position = memoryview(trie_map), TRIE_HEADER.size
+        arrays = []
+        for length, typecode in ((nodes_count + 1, "I"), (edges_count, "I"), (edges_count, "I"),
+                                 (nodes_count, "B")):
+            size = length * (4 if typecode == "I" else 1)
+            arrays.append(view[position:position + size].cast(typecode))
+            position += size
+        return cls(*arrays, words_count, bool(reverse))
+
+    def save(self, filepath: str):
+        with open(filepath, "wb") as trie_file:
+            trie_file.write(TRIE_HEADER.pack(TRIE_MAGIC, self.reverse, len(self.terminals), len(self.labels),
+                                             self.words_count))
+            for values, typecode in ((self.edges_start, "I"), (self.labels, "I"), (self.targets, "I"),
+                                     (self.terminals, "B")):
+                trie_file.write(array(typecode, values).tobytes())
+
+    def _follow(self, string: str, check_orientation=None) -> int:
+        """Returns the node reached by following the string's characters from the root, or -1"""
+        if check_orientation is not None and check_orientation != self.reverse:
+            raise ValueError("%s queries need a %strie" % (("suffix", "reversed ") if self.reverse else
+                                                          ("prefix", "")))
+        node, labels = self.root, self.labels
+        for char in (reversed(string) if self.reverse else string):
+            start, end = self.edges_start[node], self.edges_start[node + 1]
+            index = bisect_left(labels, ord(char), start, end)
+            if index == end or labels[index] != ord(char):
+                return -1
+            node = self.targets[index]
+        return node
 
+    def __contains__(self, word: str) -> bool:
+        node = self._follow(word)
+        return node != -1 and bool(self.terminals[node])
 
+    def __len__(self):
+        return self.words_count
 
+    def __iter__(self) -> Iterator[str]:
+        return self._completions(self.root, "")
+
+    def _completions(self, node: int, affix: str) -> Iterator[str]:
+        stack = [(node, affix)]
+        while stack:
+            node, word = stack.pop()
+            if self.terminals[node]:
+                yield word
+            for index in reversed(range(self.edges_start[node], self.edges_start[node + 1])):
+                char = chr(self.labels[index])
+                stack.append((self.targets[index], char + word if self.reverse else word + char))
+
+    def has_prefix(self, prefix: str) -> bool:
+        return self._follow(prefix, check_orientation=False) != -1
+
+    def has_suffix(self, suffix: str) -> bool:
+        return self._follow(suffix, check_orientation=True) != -1
+
+    def with_prefix(self, prefix: str) -> Iterator[str]:
+        """The words starting with prefix, in alphabetical order"""
+        node = self._follow(prefix, check_orientation=False)
+        return self._completions(node, prefix) if node != -1 else iter(())
+
+    def with_suffix(self, suffix: str) -> Iterator[str]:
+        """The words ending with suffix, sorted on their reversed characters"""
+        node = self._follow(suffix, check_orientation=True)
+        return self._completions(node, suffix) if node != -1 else iter(())
+
+    @property
+    def size(self) -> int:
+        """Size of the arrays, in bytes"""
+        return sum(len(values) * (4 if values is not self.terminals else 1)
+                   for values in (self.edges_start, self.labels, self.targets, self.terminals))
@@ -4,12 +4,11 @@ import random
 from os import path, listdir
 
 import numpy
-from scipy.io.wavfile import read
 
 from tools.effects import EffectGroup
 from tools.phonems import PhonemList
 from tools.effects import PhonemicEffect, AudioEffect, ExplicitTextEffect
-from tools.audio_tools import get_sounds, mix_tracks
+from tools.audio_tools import get_sounds, mix_tracks, sample_bank
 
 
 class PhonemicShuffleEffect(PhonemicEffect):
@@ -128,8 +127,7 @@ class VenerEffect(EffectGroup):
         monkey_patched = AmbianceEffect()
         monkey_patched._timeout = 120
         monkey_patched.gain = 0.2
-        with open(self._sound_file, "rb") as sndfile:
-            monkey_patched.rate, monkey_patched.track_data = read(sndfile)
+        monkey_patched.rate, monkey_patched.track_data = sample_bank.get(self._sound_file)
         return [self.UPPERCASEEffect(), monkey_patched]
 
 class AmbianceEffect(AudioEffect):
@@ -148,8 +146,7 @@ class AmbianceEffect(AudioEffect):
         super().__init__()
         filename = random.choice(list(self.effects_mapping.keys()))
         self._name, self.gain = self.effects_mapping[filename]
-        with open(path.join(self.data_folder, filename + ".wav"), "rb") as sndfile:
-            self.rate, self.track_data = read(sndfile)
+        self.rate, self.track_data = sample_bank.get(path.join(self.data_folder, filename + ".wav"))
 
     @property
     def name(self):
@@ -176,8 +173,7 @@ class BeatsEffect(AudioEffect):
         self._name, directories = random.choice(list(self._directories.items()))
         dir = random.choice(directories)
         beat_filename = random.choice(listdir(path.join(self.main_dir, dir)))
-        with open(path.join(self.main_dir, dir, beat_filename), "rb") as sndfile:
-            self.rate, self.track = read(sndfile)
+        self.rate, self.track = sample_bank.get(path.join(self.main_dir, dir, beat_filename))
 
     @property
     def name(self):
@@ -0,0 +1,60 @@
+"""Estimation of the size of a message's audio render before it's rendered, so that the renders that would go
+over their user's rate limit (which is counted in bytes of audio) aren't rendered at all.
+
+The audio's size is proportional to its duration, which is estimated from the length of the text and the
+voice's speed (in words per minute), or from the phonemes' durations when the phonemes are already known.
+Both estimates are calibrated against the sizes of the actual renders, which absorbs the wav header, the
+sampling rate, and the average effect of the voices. The renders with phonemic or audio effects, whose sizes
+have little to do with their text, aren't used for the calibration."""
+from typing import Optional
+
+from config import RENDER_ESTIMATE_MARGIN
+
+
+class RenderSizeEstimator:
+    # weight of each actual render in the calibrated ratios
+    calibration_rate = 0.05
+
+    def __init__(self, margin: float = RENDER_ESTIMATE_MARGIN):
+        self.margin = margin
+        # calibrated ratios, starting from 16kHz 16 bits audio, and about 5.5 characters per word: a character
+        # lasts 11 seconds at one word per minute
+        self.bytes_per_char = 32000 * 11  # for one character at one word per minute
+        self.bytes_per_ms = 32  # for one millisecond of phonemes
+        self.calibrations, self.skipped = 0, 0
+        self.mean_error = 0.0  # mean relative error of the estimates, against the actual renders
+
+    def estimate(self, text: str, speed: int, phonemes_duration: Optional[int] = None) -> float:
+        """Size (in bytes) of the audio render of the text, at the given speed, or of phonemes lasting
+        phonemes_duration milliseconds"""
+        if phonemes_duration is not None:
+            return self.bytes_per_ms * phonemes_duration
+        return self.bytes_per_char * len(text) / speed
+
+    def fits(self, text: str, speed: int, max_size: float, phonemes_duration: Optional[int] = None) -> bool:
+        """Whether the render may be under max_size bytes: it's only ruled out if it's over that size
+        by a safe margin"""
+        if max_size > 0 and self.estimate(text, speed, phonemes_duration) * self.margin < max_size:
+            return True
+        self.skipped += 1
+        return False
+
+    def calibrate(self, text: str, speed: int, size: int, phonemes_duration: Optional[int] = None):
+        """Adjusts the estimates with the actual size of a render"""
+        if not size or not text:
+            return
+        estimate = self.estimate(text, speed, phonemes_duration)
+        self.mean_error += self.calibration_rate * (abs(estimate - size) / size - self.mean_error)
+        if phonemes_duration:
+            self.bytes_per_ms += self.calibration_rate * (size / phonemes_duration - self.bytes_per_ms)
+        elif phonemes_duration is None:
+            self.bytes_per_char += self.calibration_rate * (size * speed / len(text) - self.bytes_per_char)
+        self.calibrations += 1
+
+    @property
+    def stats(self):
+        return {"calibrations": self.calibrations, "skipped": self.skipped, "mean_error": self.mean_error,
+                "bytes_per_char": self.bytes_per_char, "bytes_per_ms": self.bytes_per_ms}
+
+
+render_estimator = RenderSizeEstimator()
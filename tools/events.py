@@ -5,6 +5,7 @@ from time import time as timestamp
 import random
 
 from poke import LoultServerState
+from tools.clock import clock
 from tools.effects.effects import AutotuneEffect, ReverbManEffect, SkyblogEffect, RobotVoiceEffect, \
     AngryRobotVoiceEffect, PitchShiftEffect, GrandSpeechMasterEffect, VisualEffect, VoiceCloneEffect, \
     VoiceSpeedupEffect, BadCellphoneEffect, RythmicEffect
@@ -83,8 +84,8 @@ class EffectEvent(PeriodicEvent):
 
     def _select_random_users(self, user_list: List[User]) -> List[User]:
         #filtering out users who haven't talked in the last 20 minutes
-        now = datetime.now()
-        users = [user for user in user_list if (now - user.state.last_message).seconds < 20 * 60]
+        now = clock.now()
+        users = [user for user in user_list if now - user.state.last_message < 20 * 60]
         # selecting 3 random users
         selected_users = []
         while users and len(selected_users) < 3:
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+"""Read-only lexicons used by the text effects (the contradictor's verbs and the rhymes of "poil au ..."),
+stored in files that are memory-mapped the first time they're looked up, and are then shared by all the
+effects of the process (and by its forked children), without ever being copied into python objects.
+The verbs are in a trie (see tools.effects.tree), the rhymes in a sorted string table: a file holding
+a count, the offsets of the records, then the records themselves, sorted by their utf-8 bytes.
+
+The users' profiles tables (see tools.users) are unsorted string tables. The lexicons and tables are
+compiled from the text files of their data folders with:
+
+    python3 -m tools.lexicon [verbs|rhymes|profiles]
+
+Compiling the rhymes needs espeak and voxpopuli, to get the phonemes of the words."""
+import csv
+import random
+import sys
+from bisect import bisect_left
+from mmap import mmap, ACCESS_READ
+from os import path
+from struct import Struct
+from typing import List, Iterable, Optional, NamedTuple
+
+from tools.effects.tree import Trie
+
+DATA_FOLDER = path.join(path.dirname(path.realpath(__file__)), "effects", "data")
+VERBS_LIST_FILEPATH = path.join(DATA_FOLDER, "contradicteur", "liste_verbes.txt")
+VERBS_TRIE_FILEPATH = path.join(DATA_FOLDER, "contradicteur", "verbs.dawg")
+WORDS_FILEPATH = path.join(DATA_FOLDER, "pwezie", "noms_communs.txt")
+RHYMES_TABLE_FILEPATH = path.join(DATA_FOLDER, "pwezie", "rhymes.sst")
+
+TABLE_HEADER = Struct("<4sI")  # magic, records count
+TABLE_MAGIC = b"SST1"
+OFFSET = Struct("<I")
+# separates a rhyme's fields in its record, and follows each of the (reversed) phonemes of its key
+FIELDS_SEPARATOR, PHONEMES_SEPARATOR = "\t", " "
+SILENCE = "_"
+
+
+class StringTable:
+    """A string table, memory-mapped on its first lookup. It's a read-only sequence of the records' bytes,
+    so a sorted table can be searched with the bisect module. Unsorted tables keep their records in their
+    original order, and are only looked up by index."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._map = None  # type:mmap
+        self._offsets = None  # type:memoryview
+        self._count = 0
+        self._records_start = 0
+
+    def _load(self):
+        with open(self.filepath, "rb") as table_file:
+            self._map = mmap(table_file.fileno(), 0, access=ACCESS_READ)
+        magic, self._count = TABLE_HEADER.unpack_from(self._map)
+        if magic != TABLE_MAGIC:
+            raise ValueError("%s isn't a string table" % self.filepath)
+        self._records_start = TABLE_HEADER.size + OFFSET.size * (self._count + 1)
+        self._offsets = memoryview(self._map)[TABLE_HEADER.size:self._records_start].cast("I")
+
+    def __len__(self):
+        if self._map is None:
+            self._load()
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        if self._map is None:
+            self._load()
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._map[self._records_start + self._offsets[index]:self._records_start + self._offsets[index + 1]]
+
+    def string(self, index: int) -> str:
+        return self[index].decode("utf-8")
+
+    def __contains__(self, record: bytes) -> bool:
+        index = bisect_left(self, record)
+        return index < len(self) and self[index] == record
+
+    def prefix_range(self, prefix: bytes, lo=0, hi=None) -> range:
+        """Indexes of the records starting with prefix (searched for between lo and hi)"""
+        hi = len(self) if hi is None else hi
+        start = bisect_left(self, prefix, lo, hi)
+        # all the records starting with the prefix are lower than the prefix followed by the highest byte
+        return range(start, bisect_left(self, prefix + b"\xff", start, hi))
+
+    @property
+    def size(self) -> int:
+        if self._map is None:
+            self._load()
+        return len(self._map)
+
+    @staticmethod
+    def write(filepath: str, records: Iterable[str], sort=True):
+        encoded = [record.encode("utf-8") for record in records]
+        if sort:
+            encoded = sorted(set(encoded))
+        offsets, position = [], 0
+        for record in encoded:
+            offsets.append(position)
+            position += len(record)
+        offsets.append(position)
+        with open(filepath, "wb") as table_file:
+            table_file.write(TABLE_HEADER.pack(TABLE_MAGIC, len(encoded)))
+            table_file.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+            table_file.write(b"".join(encoded))
+
+
+class VerbsLexicon:
+    """The verbs are in a trie (they're looked up much more often than the rhymes), memory-mapped on its
+    first lookup"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._trie = None  # type:Trie
+
+    @property
+    def trie(self) -> Trie:
+        if self._trie is None:
+            self._trie = Trie.load(self.filepath)
+        return self._trie
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.trie
+
+    @staticmethod
+    def build(verbs_filepath: str, trie_filepath: str):
+        with open(verbs_filepath) as verbs_file:
+            Trie.from_words(verb.strip() for verb in verbs_file if verb.strip()).save(trie_filepath)
+
+
+class Rhyme(NamedTuple):
+    text: str
+    genre: str
+    nombre: str
+
+
+def rhyme_key(phonemes: List[str]) -> str:
+    """The phonemes, from the last to the first, each followed by a separator (so that the keys starting
+    with a word's last phonemes are the ones of the words rhyming with it)"""
+    return "".join(phonem + PHONEMES_SEPARATOR for phonem in reversed(phonemes) if phonem != SILENCE)
+
+
+class RhymesLexicon:
+    """Nouns, looked up by the end of their pronunciation. Each record is the rhyme's key followed by the
+    noun, its genre and its number"""
+
+    def __init__(self, filepath: str, lang="fr"):
+        self.table = StringTable(filepath)
+        self.lang = lang
+        self._voice = None
+
+    def to_phonemes(self, word: str) -> List[str]:
+        if self._voice is None:
+            from voxpopuli import Voice
+            self._voice = Voice(lang=self.lang)
+        return [phonem.name for phonem in self._voice.to_phonemes(word)]
+
+    def _rhyme(self, index: int) -> Rhyme:
+        return Rhyme(*self.table[index].decode("utf-8").split(FIELDS_SEPARATOR)[1:])
+
+    def find_rhyme(self, word: str) -> Optional[Rhyme]:
+        return self.find_rhyme_of_phonemes(self.to_phonemes(word), word)
+
+    def find_rhyme_of_phonemes(self, phonemes: List[str], word: str) -> Optional[Rhyme]:
+        """Picks randomly one of the nouns (other than the word itself) sharing the longest ending
+        with the word's phonemes"""
+        ranges = []
+        key = b""
+        records_range = range(0, len(self.table))
+        for phonem in rhyme_key(phonemes).split(PHONEMES_SEPARATOR)[:-1]:
+            key += (phonem + PHONEMES_SEPARATOR).encode("utf-8")
+            records_range = self.table.prefix_range(key, records_range.start, records_range.stop)
+            if not records_range:
+                break
+            ranges.append(records_range)
+
+        for records_range in reversed(ranges):
+            # starting from a random record, the first one that isn't the word itself
+            start = random.randrange(len(records_range))
+            for i in range(len(records_range)):
+                rhyme = self._rhyme(records_range[(start + i) % len(records_range)])
+                if rhyme.text != word:
+                    return rhyme
+        return None
+
+    def build(self, words_filepath: str, table_filepath: str):
+        with open(words_filepath) as words_csv:
+            rows = list(csv.DictReader(words_csv, delimiter="\t"))
+        StringTable.write(table_filepath, (FIELDS_SEPARATOR.join((rhyme_key(self.to_phonemes(row["ortho"])),
+                                                                  row["ortho"], row["genre"], row["nombre"]))
+                                           for row in rows))
+
+
+verbs_lexicon = VerbsLexicon(VERBS_TRIE_FILEPATH)
+rhymes_lexicon = RhymesLexicon(RHYMES_TABLE_FILEPATH)
+
+
+if __name__ == "__main__":
+    lexicons = sys.argv[1:] or ["verbs", "rhymes", "profiles"]
+    if "verbs" in lexicons:
+        VerbsLexicon.build(VERBS_LIST_FILEPATH, VERBS_TRIE_FILEPATH)
+        print("%d verbs written to %s" % (len(VerbsLexicon(VERBS_TRIE_FILEPATH).trie), VERBS_TRIE_FILEPATH))
+    if "rhymes" in lexicons:
+        rhymes_lexicon.build(WORDS_FILEPATH, RHYMES_TABLE_FILEPATH)
+        print("%d rhymes written to %s" % (len(RhymesLexicon(RHYMES_TABLE_FILEPATH).table), RHYMES_TABLE_FILEPATH))
+    if "profiles" in lexicons:
+        from tools.users import PROFILE_TABLES, build_profile_tables
+        build_profile_tables()
+        for name, (_, table) in PROFILE_TABLES.items():
+            print("%d %s written to %s" % (len(StringTable(table)), name, table))
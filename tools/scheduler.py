@@ -0,0 +1,110 @@
+"""Scheduling of the messages' audio renders: only a few of them run at the same time (as many as there are
+CPU cores, by default), the others waiting for their turn. The waiting renders are served by channel priority,
+then in turns between the users, so a user sending lots of messages only delays their own renders. A render
+that has waited for too long is dropped, its message being sent without any sound."""
+import logging
+from asyncio import get_event_loop, CancelledError, Future
+from collections import OrderedDict, deque
+from os import cpu_count
+from typing import Deque, Dict, Hashable
+
+from config import RENDER_MAX_CONCURRENCY, RENDER_MAX_WAIT
+from tools.clock import clock
+
+logger = logging.getLogger('tools')
+
+
+class RenderRequest:
+    __slots__ = ("future", "user_key", "priority", "queued_time")
+
+    def __init__(self, future: Future, user_key: Hashable, priority: int, queued_time: float):
+        self.future = future
+        self.user_key = user_key
+        self.priority = priority
+        self.queued_time = queued_time
+
+
+class RenderScheduler:
+
+    def __init__(self, max_renders: int = None, max_wait: float = RENDER_MAX_WAIT):
+        self.max_renders = max_renders or cpu_count() or 1
+        self.max_wait = max_wait  # in seconds
+        self.running = 0
+        self.queued = 0
+        # for each priority, the users' waiting renders, the user whose turn it is coming first
+        self._queues = {}  # type:Dict[int, OrderedDict[Hashable, Deque[RenderRequest]]]
+        self.granted, self.dropped = 0, 0
+        self.total_wait, self.max_waited = 0.0, 0.0
+
+    async def acquire(self, user_key: Hashable, priority: int = 0) -> bool:
+        """Waits for a render slot, which has then to be released. Returns False (without a slot) if it
+        couldn't be given one in time. The lower the priority, the sooner the render is served."""
+        if self.running < self.max_renders and not self.queued:
+            self.running += 1
+            self.granted += 1
+            return True
+
+        loop = get_event_loop()
+        request = RenderRequest(loop.create_future(), user_key, priority, clock.now())
+        self._queues.setdefault(priority, OrderedDict()).setdefault(user_key, deque()).append(request)
+        self.queued += 1
+        deadline = loop.call_later(self.max_wait, self._expire, request)
+        try:
+            return await request.future
+        except CancelledError:
+            if not request.future.cancelled():
+                if request.future.result():  # the slot was given just before the cancellation
+                    self.release()
+            elif request in self._queues[priority].get(user_key, ()):
+                self._unqueue(request)
+            raise
+        finally:
+            deadline.cancel()
+
+    def release(self):
+        self.running -= 1
+        while self.running < self.max_renders and self.queued:
+            request = self._next_request()
+            self.queued -= 1
+            if request.future.cancelled():  # its task is being cancelled
+                continue
+            self.running += 1
+            self.granted += 1
+            waited = clock.now() - request.queued_time
+            self.total_wait += waited
+            self.max_waited = max(self.max_waited, waited)
+            request.future.set_result(True)
+
+    def _next_request(self) -> RenderRequest:
+        priority = min(priority for priority, users in self._queues.items() if users)
+        users = self._queues[priority]
+        user_key, requests = next(iter(users.items()))
+        request = requests.popleft()
+        if requests:
+            users.move_to_end(user_key)  # the user's next render comes after the other users' ones
+        else:
+            del users[user_key]
+        return request
+
+    def _unqueue(self, request: RenderRequest):
+        users = self._queues[request.priority]
+        users[request.user_key].remove(request)
+        if not users[request.user_key]:
+            del users[request.user_key]
+        self.queued -= 1
+
+    def _expire(self, request: RenderRequest):
+        if not request.future.done():
+            self._unqueue(request)
+            self.dropped += 1
+            logger.warning("Render dropped after waiting for %.1fs, message sent without sound" % self.max_wait)
+            request.future.set_result(False)
+
+    @property
+    def stats(self):
+        return {"running": self.running, "queued": self.queued, "granted": self.granted, "dropped": self.dropped,
+                "mean_wait": self.total_wait / self.granted if self.granted else 0.0,
+                "max_wait": self.max_waited}
+
+
+render_scheduler = RenderScheduler(RENDER_MAX_CONCURRENCY)
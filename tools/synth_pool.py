@@ -0,0 +1,214 @@
+"""Pool of synthesis processes (espeak/mbrola) spawned ahead of time, so that rendering a message doesn't
+have to wait for a fork/exec and a voice database load"""
+import logging
+import os
+from asyncio import create_subprocess_exec, ensure_future, gather, Semaphore
+from asyncio.subprocess import PIPE, DEVNULL
+from collections import OrderedDict, deque
+from typing import Deque, Tuple, AsyncIterator
+
+from config import SYNTH_WARM_WORKERS, SYNTH_MAX_VOICES, SYNTH_MAX_JOBS, SYNTH_MAX_PENDING, SYNTH_CHUNK_SIZE
+from tools.scheduler import render_scheduler
+
+logger = logging.getLogger('tools')
+
+# a pipeline is a sequence of commands (each one being an argv tuple), the output of each command
+# being piped into the next one
+Pipeline = Tuple[Tuple[str, ...], ...]
+
+# mbrola tends to crash when freeing its memory on exit, this keeps the libc from aborting on it
+SYNTH_ENV = dict(os.environ, MALLOC_CHECK_="0")
+
+
+def format_pipeline(pipeline: Pipeline) -> str:
+    return " | ".join(" ".join(cmd) for cmd in pipeline)
+
+
+class SynthPoolError(Exception):
+    pass
+
+
+class SynthPoolFull(SynthPoolError):
+    """Raised when too many synthesis jobs are already waiting for a slot"""
+    pass
+
+
+class WorkerCrashed(SynthPoolError):
+    pass
+
+
+class SynthWorker:
+    """A synthesis pipeline that's already running, blocked on its stdin until it's handed a request.
+    espeak and mbrola only flush their output once their input is closed, so a worker serves a single request.
+
+    The processes are directly exec'd (there is no shell involved), and each of them is directly plugged into
+    the next one's stdin through an OS pipe."""
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    @classmethod
+    async def spawn(cls, pipeline: Pipeline) -> 'SynthWorker':
+        processes = []
+        stdin = PIPE
+        for i, cmd in enumerate(pipeline):
+            next_stdin, stdout = os.pipe() if i < len(pipeline) - 1 else (None, PIPE)
+            try:
+                processes.append(await create_subprocess_exec(*cmd, stdin=stdin, stdout=stdout,
+                                                              stderr=DEVNULL, env=SYNTH_ENV))
+            except OSError:
+                if next_stdin is not None:
+                    os.close(next_stdin)
+                # the stages already started are killed and reaped, so they don't linger as zombies
+                for process in processes:
+                    if process.returncode is None:
+                        process.kill()
+                await gather(*(process.wait() for process in processes))
+                raise
+            finally:
+                # the children have their own copies of the pipe's ends
+                for fd in (stdin, stdout):
+                    if fd != PIPE:
+                        os.close(fd)
+            stdin = next_stdin
+        return cls(processes)
+
+    @property
+    def is_alive(self):
+        return all(process.returncode is None for process in self.processes)
+
+    async def _feed(self, input_data: bytes):
+        stdin = self.processes[0].stdin
+        try:
+            stdin.write(input_data)
+            await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the process died, this is handled when checking the output
+        stdin.close()
+
+    async def stream(self, input_data: bytes, chunk_size: int = SYNTH_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Yields the pipeline's output chunk by chunk, as soon as it's produced"""
+        feeding = ensure_future(self._feed(input_data))
+        stdout = self.processes[-1].stdout
+        output_size, finished = 0, False
+        try:
+            chunk = await stdout.read(chunk_size)
+            while chunk:
+                output_size += len(chunk)
+                yield chunk
+                chunk = await stdout.read(chunk_size)
+            finished = True
+        finally:
+            if not finished:  # the consumer gave up, the rest of the output still has to be read for the pipeline to exit
+                ensure_future(self._reap())
+
+        await feeding
+        return_codes = await gather(*(process.wait() for process in self.processes))
+        # mbrola tends to crash when freeing its memory on exit (hence the MALLOC_CHECK_), so the return codes
+        # alone aren't reliable: the pipeline only failed if it didn't output anything
+        if not output_size and any(return_codes):
+            raise WorkerCrashed()
+
+    async def run(self, input_data: bytes) -> bytes:
+        return b"".join([chunk async for chunk in self.stream(input_data)])
+
+    async def _reap(self):
+        if self.processes[0].stdin.is_closing():  # already fed, only the output has to be drained
+            await self.processes[-1].stdout.read()
+            await gather(*(process.wait() for process in self.processes))
+        else:
+            try:
+                await self.run(b"")
+            except WorkerCrashed:
+                pass
+
+    def retire(self):
+        """Closes the worker's stdin, which makes it exit on its own, and reaps it"""
+        ensure_future(self._reap())
+
+
+class SynthPool:
+    """Keeps, for each synthesis pipeline, a few idle workers ready to be used. Pipelines are forgotten
+    in a LRU fashion, and the number of running and waiting jobs is bounded. The renders going through the
+    render scheduler first, the jobs have by default as many slots as the scheduler lets renders run."""
+
+    def __init__(self, warm_workers=SYNTH_WARM_WORKERS, max_voices=SYNTH_MAX_VOICES,
+                 max_jobs=SYNTH_MAX_JOBS, max_pending=SYNTH_MAX_PENDING):
+        max_jobs = max_jobs or render_scheduler.max_renders
+        self.warm_workers = warm_workers
+        self.max_voices = max_voices
+        # the renders let through by the scheduler can't be refused for lack of room
+        self.max_pending = max(max_pending, max_jobs)
+        self.pending = 0
+        self.crashes = 0
+        self._jobs_slots = Semaphore(max_jobs)
+        self._idle = OrderedDict()  # type:OrderedDict[Pipeline, Deque[SynthWorker]]
+
+    def _idle_workers(self, pipeline: Pipeline) -> Deque[SynthWorker]:
+        if pipeline in self._idle:
+            self._idle.move_to_end(pipeline)
+        else:
+            self._idle[pipeline] = deque()
+            if len(self._idle) > self.max_voices:
+                _, evicted = self._idle.popitem(last=False)
+                for worker in evicted:
+                    worker.retire()
+        return self._idle[pipeline]
+
+    async def _refill(self, pipeline: Pipeline):
+        try:
+            worker = await SynthWorker.spawn(pipeline)
+        except OSError as err:
+            logger.warning("Couldn't spawn synthesis worker: %s" % err)
+            return
+        idle = self._idle.get(pipeline)
+        if idle is None or len(idle) >= self.warm_workers:  # the pipeline got evicted or refilled meanwhile
+            worker.retire()
+        else:
+            idle.append(worker)
+
+    async def _checkout(self, pipeline: Pipeline) -> SynthWorker:
+        idle = self._idle_workers(pipeline)
+        worker = None
+        while idle and worker is None:
+            worker = idle.popleft()
+            if not worker.is_alive:  # died while waiting, it's replaced by a new one
+                logger.warning("Idle synthesis worker for '%s' has died" % format_pipeline(pipeline))
+                self.crashes += 1
+                worker.retire()
+                worker = None
+        ensure_future(self._refill(pipeline))
+        return worker if worker is not None else await SynthWorker.spawn(pipeline)
+
+    async def stream(self, pipeline: Pipeline, input_data: bytes = b"") -> AsyncIterator[bytes]:
+        """Runs a synthesis pipeline on the input data, and yields its output as it's produced"""
+        if self.pending >= self.max_pending:
+            raise SynthPoolFull()
+
+        self.pending += 1
+        try:
+            async with self._jobs_slots:
+                try:
+                    async for chunk in (await self._checkout(pipeline)).stream(input_data):
+                        yield chunk
+                except WorkerCrashed:
+                    # a crashed worker didn't output anything, so it can be given a second chance with a fresh one
+                    self.crashes += 1
+                    logger.warning("Synthesis worker for '%s' crashed, retrying" % format_pipeline(pipeline))
+                    async for chunk in (await self._checkout(pipeline)).stream(input_data):
+                        yield chunk
+        finally:
+            self.pending -= 1
+
+    async def run(self, pipeline: Pipeline, input_data: bytes = b"") -> bytes:
+        """Runs a synthesis pipeline on the input data, and returns its output"""
+        return b"".join([chunk async for chunk in self.stream(pipeline, input_data)])
+
+    def close(self):
+        for idle in self._idle.values():
+            for worker in idle:
+                worker.retire()
+        self._idle.clear()
+
+
+synth_pool = SynthPool()
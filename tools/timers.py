@@ -0,0 +1,109 @@
+"""A hierarchical timer wheel, holding the server's many coarse timers (the effects' expiry, the flood warnings'
+and bans' resets, the IPs' reconnection delays) instead of the event loop: each of them would otherwise be
+an expiry date checked on every message, or a handle in the loop's heap.
+
+The wheel has several levels of slots: a timer is put in the slot of the lowest level whose span covers its
+delay, and a slot of an upper level is spread over the level below it when the wheel reaches it. Scheduling
+and cancelling a timer are then constant-time, and the wheel only needs one loop handle, which ticks while
+timers are pending."""
+import logging
+from asyncio import get_event_loop
+from math import ceil
+from typing import Callable, List
+
+from config import TIMER_WHEEL_RESOLUTION, TIMER_WHEEL_SLOTS, TIMER_WHEEL_LEVELS
+from tools.clock import clock as shared_clock
+
+logger = logging.getLogger('tools')
+
+
+class Timer:
+    __slots__ = ("tick", "callback", "args", "cancelled")
+
+    def __init__(self, tick: int, callback: Callable, args: tuple):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+
+    def __init__(self, resolution: float = TIMER_WHEEL_RESOLUTION, slots: int = TIMER_WHEEL_SLOTS,
+                 levels: int = TIMER_WHEEL_LEVELS, clock: Callable[[], float] = shared_clock.now, autostart=True):
+        self.resolution = resolution  # in seconds, the duration of a tick
+        self.slots = slots
+        self.clock = clock
+        # if set, the wheel advances itself from the event loop while it has timers
+        self.autostart = autostart
+        # the span of each level's slots (in ticks), and the span of the whole wheel
+        self._spans = [slots ** level for level in range(levels)]
+        self._horizon = slots ** levels
+        self._wheel = [[[] for _ in range(slots)] for _ in range(levels)]  # type:List[List[List[Timer]]]
+        self._tick = self._now_tick()
+        self._handle = None
+        self.pending = 0
+
+    def _now_tick(self) -> int:
+        return int(self.clock() / self.resolution)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Calls callback(*args) once delay (in seconds) has passed, possibly up to one tick later"""
+        if not self.pending:  # the wheel hasn't advanced while it was empty, its slots are relative to then
+            self._tick = self._now_tick()
+        timer = Timer(max(self._now_tick(), self._tick) + max(1, ceil(delay / self.resolution)), callback, args)
+        self._insert(timer)
+        self.pending += 1
+        if self.autostart and self._handle is None:
+            self._handle = get_event_loop().call_later(self.resolution, self._on_tick)
+        return timer
+
+    def _insert(self, timer: Timer):
+        # timers beyond the wheel's horizon are put in its last slot, and put back in the wheel from there
+        tick = min(timer.tick, self._tick + self._horizon - 1)
+        for level, span in enumerate(self._spans):
+            if tick - self._tick < span * self.slots:
+                self._wheel[level][(tick // span) % self.slots].append(timer)
+                return
+
+    def advance(self):
+        """Runs the timers that have expired since the last time the wheel advanced"""
+        target = self._now_tick()
+        while self._tick < target:
+            if not self.pending:  # nothing to run until now
+                self._tick = target
+                break
+            self._tick += 1
+            # the upper levels' slots reached by the wheel are spread over the lower levels, starting
+            # from the highest, so that the timers end up in the slots processed on this very tick
+            for level in reversed(range(1, len(self._spans))):
+                span = self._spans[level]
+                if self._tick % span == 0:
+                    self._cascade(self._wheel[level], (self._tick // span) % self.slots)
+            self._cascade(self._wheel[0], self._tick % self.slots)
+
+    def _cascade(self, level_slots: List[List[Timer]], slot: int):
+        timers, level_slots[slot] = level_slots[slot], []
+        for timer in timers:
+            if timer.cancelled:
+                self.pending -= 1
+            elif timer.tick <= self._tick:
+                self.pending -= 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logger.exception("Error in timer callback %r" % timer.callback)
+            else:
+                self._insert(timer)
+
+    def _on_tick(self):
+        self._handle = None
+        self.advance()  # the expired timers' callbacks may have scheduled new timers
+        if self.pending and self._handle is None:
+            self._handle = get_event_loop().call_later(self.resolution, self._on_tick)
+
+
+timer_wheel = TimerWheel()
@@ -1,23 +1,25 @@
 import json
 import logging
 import re
-from asyncio import create_subprocess_shell
-from asyncio.subprocess import PIPE
-from io import BytesIO
+from asyncio import create_subprocess_exec, Semaphore
+from asyncio.subprocess import PIPE, DEVNULL
 from itertools import chain
 from re import sub
-from shlex import quote
-from struct import pack
-from typing import Union
+from shutil import which
+from struct import Struct
+from typing import Union, Tuple, AsyncIterator, List
 from collections import OrderedDict
 
 import numpy
-from scipy.io import wavfile
 
 from resampy import resample
 
-from tools.audio_tools import BASE_SAMPLING_RATE
+from config import OPUS_BITRATE, OPUS_MAX_JOBS
+from tools.audio_pool import audio_effects_pool
+from tools.audio_tools import BASE_SAMPLING_RATE, WavBuffer
+from tools.cache import render_cache, phonemes_cache, mbrola_cache
 from tools.phonems import PhonemList, Phonem
+from tools.synth_pool import synth_pool, SynthPoolFull, SynthPoolError, format_pipeline
 
 logger = logging.getLogger('tools')
 
@@ -42,6 +44,14 @@ class AudioRenderer:
     volumes_presets = {'fr1': 1.17138, 'fr2': 1.60851, 'fr3': 1.01283, 'fr4': 1.0964, 'fr5': 2.64384, 'fr6': 1.35412,
                        'fr7': 1.96092, 'us1': 1.658, 'us2': 1.7486, 'us3': 3.48104, 'es1': 3.26885, 'es2': 1.84053}
 
+    pool = synth_pool
+    render_cache = render_cache
+    phonemes_cache = phonemes_cache
+    mbrola_cache = mbrola_cache
+    effects_pool = audio_effects_pool
+    opus_available = which('opusenc') is not None
+    opus_jobs = Semaphore(OPUS_MAX_JOBS)
+
     def _get_additional_params(self, lang, voice_params : 'VoiceParameters'):
         """Uses the msg's lang field to figure out the voice, sex, and volume of the synth"""
         lang, voices = self.lang_voices_mapping.get(lang, self.lang_voices_mapping["fr"])
@@ -58,66 +68,125 @@ class AudioRenderer:
 
         return lang, voice, sex, volume
 
-    def _wav_format(self, wav : bytes):
-        """Since the wav returned by Mbrola has an incomplete header (size of the wav isn't set), this
-        function sets the wav's RIFF header to their actual values"""
-        return wav[:4] + pack('<I', len(wav) - 8) + wav[8:40] + pack('<I', len(wav) - 44) + wav[44:]
+    @staticmethod
+    def _espeak_cmd(lang : str, sex : int, voice_params : 'VoiceParameters') -> Tuple[str, ...]:
+        return ('espeak', '-s', str(voice_params.speed), '-p', str(voice_params.pitch), '--pho', '-q',
+                '-v', 'mb/mb-%s%d' % (lang, sex), '--stdin')
+
+    @staticmethod
+    def _mbrola_cmd(lang : str, voice : int, volume : float) -> Tuple[str, ...]:
+        return ('mbrola', '-v', '%g' % volume, '-e', '/usr/share/mbrola/%s%d/%s%d' % (lang, voice, lang, voice),
+                '-', '-.wav')
+
+    async def _stream_synth(self, pipeline : Tuple[Tuple[str, ...], ...], input_data : bytes) -> AsyncIterator[bytes]:
+        logger.debug("Running synth pipeline %s" % format_pipeline(pipeline))
+        try:
+            async for chunk in self.pool.stream(pipeline, input_data):
+                yield chunk
+        except SynthPoolFull:
+            logger.warning("Too many synthesis jobs pending, message rendered without sound")
+        except SynthPoolError:
+            logger.warning("Synthesis pipeline %s failed twice, message rendered without sound"
+                           % format_pipeline(pipeline))
+
+    async def _run_synth(self, pipeline : Tuple[Tuple[str, ...], ...], input_data : bytes) -> bytes:
+        return b"".join([chunk async for chunk in self._stream_synth(pipeline, input_data)])
+
+    @staticmethod
+    def join_chunks(chunks : List[bytes]) -> bytes:
+        """Reassembles a streamed render into a proper wav. Since the wav returned by Mbrola has an
+        incomplete header (size of the wav isn't set), the header's size fields are set in the process"""
+        if not any(chunks):
+            return b""
+        return WavBuffer.from_chunks(chunks).buffer
+
+    def stream_string_to_audio(self, text : str, lang : str, voice_params : 'VoiceParameters') -> AsyncIterator[bytes]:
+        """Renders directly a string to audio using an espeak -> mbrola pipeline, yielding the wav
+        as mbrola outputs it. The first chunk holds the wav header, with its size fields unset."""
+        lang, voice, sex, volume = self._get_additional_params(lang, voice_params)
+        pipeline = (self._espeak_cmd(lang, sex, voice_params), self._mbrola_cmd(lang, voice, volume))
+        return self._stream_synth(pipeline, text.encode('utf-8'))
 
     async def string_to_audio(self, text : str, lang : str, voice_params : 'VoiceParameters') -> bytes:
         """Renders directly a string to audio using an espeak -> mbrola pipeline
         (output is a wav bytes object)"""
+        return self.join_chunks([chunk async for chunk in self.stream_string_to_audio(text, lang, voice_params)])
+
+    async def stream_phonemes_to_audio(self, phonemes : PhonemList, lang : str,
+                                       voice_params : 'VoiceParameters') -> AsyncIterator[bytes]:
+        """Renders a phonemlist object to audio using mbrola, yielding the wav as it's output"""
         lang, voice, sex, volume = self._get_additional_params(lang, voice_params)
-        synth_string = 'MALLOC_CHECK_=0 espeak -s %d -p %d --pho -q -v mb/mb-%s%d %s ' \
-                       '| MALLOC_CHECK_=0 mbrola -v %g -e /usr/share/mbrola/%s%d/%s%d - -.wav' \
-                       % (voice_params.speed, voice_params.pitch, lang, sex, text,
-                          volume, lang, voice, lang, voice)
-        logger.debug("Running synth command %s" % synth_string)
-        process = await create_subprocess_shell(synth_string, stderr=PIPE, stdout=PIPE)
-        wav, err = await process.communicate()
-        return self._wav_format(wav)
+        phonemes_str = str(phonemes)
+        cache_key = self.mbrola_cache.make_key(phonemes_str, lang, voice)
+        wav = self.mbrola_cache.get(cache_key)
+        if wav is not None:
+            yield wav
+            return
+
+        chunks = []
+        async for chunk in self._stream_synth((self._mbrola_cmd(lang, voice, volume),),
+                                              phonemes_str.encode('utf-8')):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.mbrola_cache.put(cache_key, self.join_chunks(chunks))
 
     async def phonemes_to_audio(self, phonemes : PhonemList, lang : str, voice_params : 'VoiceParameters') -> bytes:
         """Renders a phonemlist object to audio using mbrola"""
-        lang, voice, sex, volume = self._get_additional_params(lang, voice_params)
-        audio_synth_string = 'MALLOC_CHECK_=0 mbrola -v %g -e /usr/share/mbrola/%s%d/%s%d - -.wav' \
-                             % (volume, lang, voice, lang, voice)
-        logger.debug("Running mbrola command %s" % audio_synth_string)
-        process = await create_subprocess_shell(audio_synth_string, stdout=PIPE,
-                                                stdin=PIPE, stderr=PIPE)
-        wav, err = await process.communicate(input=str(phonemes).encode('utf-8'))
-        return self._wav_format(wav)
+        return self.join_chunks([chunk async for chunk in self.stream_phonemes_to_audio(phonemes, lang, voice_params)])
+
+    async def wav_to_opus(self, wav : bytes) -> bytes:
+        """Encodes a wav to opus (in an ogg container) using opusenc. Returns an empty
+        bytes object if opusenc isn't available or fails"""
+        if not self.opus_available:
+            return b""
+        # opusenc has its own job slots: it mustn't hold the synthesis pool's ones, nor be kept warm like a voice
+        async with self.opus_jobs:
+            try:
+                process = await create_subprocess_exec('opusenc', '--quiet', '--bitrate', str(OPUS_BITRATE), '-', '-',
+                                                       stdin=PIPE, stdout=PIPE, stderr=DEVNULL)
+                opus, _ = await process.communicate(wav)
+            except OSError as err:
+                logger.warning("Couldn't run opusenc: %s" % err)
+                return b""
+        if process.returncode != 0:
+            logger.warning("opusenc failed with code %d, message sent in wav" % process.returncode)
+            return b""
+        return opus
 
     async def string_to_phonemes(self, text : str, lang : str, voice_params : 'VoiceParameters') -> PhonemList:
-        """Renders an input string to a phonemlist object using espeak"""
+        """Renders an input string to a phonemlist object using espeak. Since espeak's output is cached
+        and parsed again each time, the returned phonemlist can be freely modified by the caller"""
         lang, voice, sex, volume = self._get_additional_params(lang, voice_params)
-        phonem_synth_string = 'MALLOC_CHECK_=0 espeak -s %d -p %d --pho -q -v mb/mb-%s%d %s ' \
-                              % (voice_params.speed, voice_params.pitch, lang, sex, text)
-        logger.debug("Running espeak command %s" % phonem_synth_string)
-        process = await create_subprocess_shell(phonem_synth_string,
-                                                stdout=PIPE, stderr=PIPE)
-        phonems, err = await process.communicate()
+        cache_key = self.phonemes_cache.make_key(text, lang, voice_params.speed, voice_params.pitch, sex)
+        phonems = self.phonemes_cache.get(cache_key)
+        if phonems is None:
+            phonems = await self._run_synth((self._espeak_cmd(lang, sex, voice_params),), text.encode('utf-8'))
+            self.phonemes_cache.put(cache_key, phonems)
         return PhonemList(phonems.decode('utf-8').strip())
 
+    def cached_phonemes(self, text : str, lang : str, voice_params : 'VoiceParameters') -> Union[PhonemList, None]:
+        """The phonemes of the text, if espeak's output is in the cache"""
+        lang, voice, sex, volume = self._get_additional_params(lang, voice_params)
+        phonems = self.phonemes_cache.peek(
+            self.phonemes_cache.make_key(text, lang, voice_params.speed, voice_params.pitch, sex))
+        return PhonemList(phonems.decode('utf-8').strip()) if phonems is not None else None
+
     @staticmethod
     async def to_f32_16k(wav : bytes) -> numpy.ndarray:
-        # converting the wav to ndarray, which is much easier to use for DSP
-        rate, data = wavfile.read(BytesIO(wav))
-        # casting the data array to the right format (float32, for usage by pysndfx)
-        data = (data / (2. ** 15)).astype('float32')
+        # converting the wav to a float32 ndarray (for usage by the DSP), which is the only copy of the samples
+        wav = WavBuffer(wav)
+        rate, data = wav.rate, wav.to_float32()
         if rate != BASE_SAMPLING_RATE:
             data = resample(data, rate, BASE_SAMPLING_RATE)
 
         return BASE_SAMPLING_RATE, data
 
     @staticmethod
-    def to_wav_bytes(data : numpy.ndarray, rate : int) -> bytes:
-        # casting it back to int16
-        data = (data * (2. ** 15)).astype("int16")
-        # then, converting it back to binary data
-        bytes_obj = bytes()
-        bytes_buff = BytesIO(bytes_obj)
-        wavfile.write(bytes_buff, rate, data)
-        return bytes_buff.read()
+    def to_wav_bytes(data : numpy.ndarray, rate : int) -> memoryview:
+        # the samples are converted back to int16 directly into the wav's buffer (data is modified in the process),
+        # which is handed out read-only since it's broadcast
+        return memoryview(WavBuffer.from_float32(data, rate).buffer).toreadonly()
 
 
 class UtilitaryEffect:
@@ -189,13 +258,28 @@ links_translation = {'fr': 'cliquez mes petits chatons',
 def prepare_text_for_tts(text : str, lang : str) -> str:
     text = sub('(https?://[^ ]*[^.,?! :])', links_translation[lang], text)
     text = text.replace('#', 'hashtag ')
-    return quote(text.strip(' -"\'`$();:.'))
+    # the text is sent to espeak through its stdin, so it doesn't need any shell quoting
+    return text.strip(' -"\'`$();:.')
+
+
+# header of the binary frames sent to the clients receiving the audio as a stream: the stream's id (as sent in
+# the "stream_id" field of the text message), the chunk's sequence number, and a flag set on the last chunk
+AUDIO_FRAME_HEADER = Struct('<IIB')
+
+
+def audio_frame(stream_id : int, seq : int, chunk : bytes, final=False) -> bytes:
+    return AUDIO_FRAME_HEADER.pack(stream_id, seq, final) + chunk
 
 
 def encode_json(data):
     return json.dumps(data, ensure_ascii=False).encode('utf-8')
 
 
+def extend_json(data, encoded_object : bytes) -> bytes:
+    """Encodes data (a dict) followed by the fields of an object that is already encoded (both non-empty)"""
+    return encode_json(data)[:-1] + b", " + encoded_object[1:]
+
+
 class OrderedDequeDict(OrderedDict):
 
     def __init__(self, size=100, *args, **kwargs):
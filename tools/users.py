@@ -1,34 +1,48 @@
 import logging
 import random
-from asyncio import get_event_loop
+from collections import OrderedDict, deque
 from colorsys import hsv_to_rgb
-from datetime import timedelta, datetime
-from re import compile as regex
+from copy import copy
 from struct import pack
-from typing import Tuple, List
+from typing import Tuple, List, AsyncIterator, NamedTuple, Dict, Deque, Optional
 from os import path
 import json
 
-from config import FLOOD_DETECTION_WINDOW, BANNED_WORDS, FLOOD_WARNING_TIMEOUT, FLOOD_DETECTION_MSG_PER_SEC, \
-    ATTACK_RESTING_TIME
+from config import FLOOD_DETECTION_WINDOW, FLOOD_WARNING_TIMEOUT, FLOOD_DETECTION_MSG_PER_SEC, \
+    ATTACK_RESTING_TIME, IDENTITY_CACHE_TTL, IDENTITY_CACHE_SIZE, RENDER_CHANNEL_PRIORITIES
 from tools import pokemons
 
-from tools.tools import AudioRenderer, SpoilerBipEffect, prepare_text_for_tts
+from tools.banned_words import BannedWordsMatcher, banned_words as shared_banned_words
+from tools.cache import RenderCache
+from tools.clock import clock
+from tools.estimator import render_estimator
+from tools.lexicon import StringTable
+from tools.scheduler import render_scheduler
+from tools.timers import TimerWheel, timer_wheel
+from tools.tools import AudioRenderer, SpoilerBipEffect, prepare_text_for_tts, encode_json
 from .phonems import PhonemList
 
 DATA_FILES_FOLDER = path.join(path.dirname(path.realpath(__file__)), "data/")
 
-with open(path.join(DATA_FILES_FOLDER, "adjectifs.txt")) as file:
-    adjectives = file.read().splitlines()
+# the profiles' data, as (text source, compiled table) files: the tables are memory-mapped when a
+# profile first needs them, and only the strings that are used are decoded
+PROFILE_TABLES = {name: (path.join(DATA_FILES_FOLDER, source), path.join(DATA_FILES_FOLDER, name + ".sst"))
+                  for name, source in (("adjectives", "adjectifs.txt"), ("jobs", "metiers.txt"),
+                                       ("cities", "villes.json"), ("sexual_orient", "sexualite.txt"))}
+CITY_SEPARATOR = "\t"  # between a city and its departement, in the cities' table
 
-with open(path.join(DATA_FILES_FOLDER, "metiers.txt")) as file:
-    jobs = file.read().splitlines()
+adjectives, jobs, cities, sexual_orient = (StringTable(table) for _, table in PROFILE_TABLES.values())
 
-with open(path.join(DATA_FILES_FOLDER, "villes.json")) as file:
-    cities = json.load(file)
 
-with open(path.join(DATA_FILES_FOLDER, "sexualite.txt")) as file:
-    sexual_orient = file.read().splitlines()
+def build_profile_tables():
+    for name, (source, table) in PROFILE_TABLES.items():
+        with open(source) as file:
+            if source.endswith(".json"):
+                records = [CITY_SEPARATOR.join(city) for city in json.load(file)]
+            else:
+                records = file.read().splitlines()
+        StringTable.write(table, records, sort=False)
+
 
 class VoiceParameters:
 
@@ -50,7 +64,7 @@ class PokeParameters:
         self.color = color
         self.poke_id = poke_id
         self.pokename = pokemons.pokemon[self.poke_id]
-        self.poke_adj = adjectives[adj_id]
+        self.poke_adj = adjectives.string(adj_id)
 
     @classmethod
     def from_cookie_hash(cls, cookie_hash):
@@ -63,10 +77,10 @@ class PokeParameters:
 class PokeProfile:
 
     def __init__(self, job_id, age, city_id, sex_orient_id):
-        self.job = jobs[job_id]
+        self.job = jobs.string(job_id)
         self.age = age
-        self.city, self.departement = cities[city_id]
-        self.sex_orient = sexual_orient[sex_orient_id]
+        self.city, self.departement = cities.string(city_id).split(CITY_SEPARATOR)
+        self.sex_orient = sexual_orient.string(sex_orient_id)
 
     def to_dict(self):
         return {"job": self.job,
@@ -85,30 +99,33 @@ class PokeProfile:
 
 class UserState:
 
-    detection_window = timedelta(seconds=FLOOD_DETECTION_WINDOW)
+    detection_window = FLOOD_DETECTION_WINDOW  # in seconds
+    flood_threshold = FLOOD_DETECTION_MSG_PER_SEC * FLOOD_DETECTION_WINDOW
 
-    def __init__(self, banned_words=BANNED_WORDS):
+    def __init__(self, banned_words=None, timers: TimerWheel = None):
         from tools import AudioEffect, HiddenTextEffect, ExplicitTextEffect, PhonemicEffect, \
             VoiceEffect
 
+        # the effects' expiry and the warnings' resets are timers of the server's wheel
+        self._timers = timer_wheel if timers is None else timers
         self.effects = {cls: [] for cls in
                         (AudioEffect, HiddenTextEffect, ExplicitTextEffect, PhonemicEffect, VoiceEffect)}
-        self.connection_time = datetime.now()
-        self.last_attack = datetime.now()  # any user has to wait some time before attacking, after entering the chan
-        self.last_message = datetime.now()
-        self.timestamps = list()
+        # monotonic times (see tools.clock)
+        self.connection_time = clock.now()
+        self.last_attack = clock.now()  # any user has to wait some time before attacking, after entering the chan
+        self.last_message = clock.now()
+        # monotonic times of the messages sent during the detection window (only the last ones matter)
+        self.timestamps = deque(maxlen=self.flood_threshold + 1)  # type:Deque[float]
         self.has_been_warned = False # User has been warned he shouldn't flood
-        self._banned_words = [regex(word) for word in banned_words]
+        # all the users share the same matcher, unless they're given their own banned words
+        self._banned_words = shared_banned_words if banned_words is None else BannedWordsMatcher(banned_words)
         self.is_shadowbanned = False # User has been shadowbanned
 
 
     def __setattr__(self, name, value):
         object.__setattr__(self, name, value)
         if name == "has_been_warned" and value:
-            # it's safe since the whole application only
-            # uses the default loop
-            loop = get_event_loop()
-            loop.call_later(FLOOD_WARNING_TIMEOUT, self._reset_warning)
+            self._timers.schedule(FLOOD_WARNING_TIMEOUT, self._reset_warning)
 
     def add_effect(self, effect):
         """Adds an effect to one of the active tools list (depending on the effect type)"""
@@ -126,26 +143,29 @@ class UserState:
                     if len(self.effects[cls]) == 5:  # only 5 effects of one type allowed at a time
                         self.effects[cls].pop(0)
                     self.effects[cls].append(efct)
+                    self._timers.schedule(efct.timeout, self._expire_effect, cls, efct)
                     break
 
+    def _expire_effect(self, cls, effect):
+        # the effect may already have been pushed out of its list by newer ones
+        if effect in self.effects[cls]:
+            self.effects[cls].remove(effect)
+
     def reset_flood_detection(self):
-        self.timestamps = list()
+        self.timestamps.clear()
 
     def check_flood(self, msg):
         self._add_timestamp()
-        threshold = FLOOD_DETECTION_MSG_PER_SEC * FLOOD_DETECTION_WINDOW
-        return len(self.timestamps) > threshold or self.censor(msg)
+        return len(self.timestamps) > self.flood_threshold or self.censor(msg)
 
     def _add_timestamp(self):
         """Add a timestamp for a user's message, and clears timestamps which are too old"""
-        # removing msg timestamps that are out of the detection window
-        now = datetime.now()
-        self.last_message = now
+        self.last_message = now = clock.now()
         self._refresh_timestamps(now)
         self.timestamps.append(now)
 
     def censor(self, msg):
-        return any(regex_word.fullmatch(msg) for regex_word in self._banned_words)
+        return self._banned_words.matches(msg)
 
     def _reset_warning(self):
         """
@@ -158,11 +178,77 @@ class UserState:
         # now has to be a possible argument else there might me slight
         # time differences between the current time of the calling function
         # and this one's current time.
-        now = now if now else datetime.now()
-        # removing msg timestamps that are out of the detection window
-        updated = [timestamp for timestamp in self.timestamps
-                   if timestamp + self.detection_window > now]
-        self.timestamps = updated
+        now = now if now else clock.now()
+        # removing msg timestamps that are out of the detection window, which are the oldest ones
+        timestamps = self.timestamps
+        while timestamps and timestamps[0] + self.detection_window <= now:
+            timestamps.popleft()
+
+
+class UserIdentity(NamedTuple):
+    """Everything about a user that is derived from its cookie. Identities are shared by all the users
+    with the same cookie, so neither they nor their fields are to be modified"""
+    user_id: str
+    voice_params: VoiceParameters
+    poke_params: PokeParameters
+    poke_profile: PokeProfile
+    info: Dict
+    info_json: bytes  # the info, already encoded in JSON
+    own_info_json: bytes  # same, with the flag telling the user's own JS client that this is its pokemon
+
+    @classmethod
+    def from_cookie_hash(cls, cookie_hash):
+        poke_params = PokeParameters.from_cookie_hash(cookie_hash)
+        poke_profile = PokeProfile.from_cookie_hash(cookie_hash)
+        user_id = cookie_hash.hex()[-16:]
+        info = {
+            'userid': user_id,
+            'params': {
+                'name': poke_params.pokename,
+                'img': str(poke_params.poke_id).zfill(3),
+                'color': poke_params.color,
+                'adjective': poke_params.poke_adj
+            },
+            'profile': poke_profile.to_dict()
+        }
+        own_info = dict(info, params=dict(info['params'], you=True))
+        return cls(user_id, VoiceParameters.from_cookie_hash(cookie_hash), poke_params, poke_profile, info,
+                   encode_json(info), encode_json(own_info))
+
+
+class IdentityCache:
+    """LRU cache of the users' identities, keyed on their cookie hash. Identities expire after a while, so that
+    the cache doesn't keep those of users that left long ago"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits, self.misses = 0, 0
+        self._entries = OrderedDict()  # type:OrderedDict[bytes, Tuple[float, UserIdentity]]
+
+    def get(self, cookie_hash: bytes) -> UserIdentity:
+        now = clock.now()
+        entry = self._entries.get(cookie_hash)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(cookie_hash)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        identity = UserIdentity.from_cookie_hash(cookie_hash)
+        self._entries[cookie_hash] = now + self.ttl, identity
+        self._entries.move_to_end(cookie_hash)
+        # the least recently used identities come first, expired ones are dropped from there
+        while self._entries and (len(self._entries) > self.max_size or next(iter(self._entries.values()))[0] <= now):
+            self._entries.popitem(last=False)
+        return identity
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+identity_cache = IdentityCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
 
 
 class User:
@@ -171,16 +257,17 @@ class User:
     def __init__(self, cookie_hash, channel, client):
         """Initiating a user using its cookie md5 hash"""
         self.audio_renderer = AudioRenderer()
-        self.voice_params = VoiceParameters.from_cookie_hash(cookie_hash)
-        self.poke_params = PokeParameters.from_cookie_hash(cookie_hash)
-        self.poke_profile = PokeProfile.from_cookie_hash(cookie_hash)
-        self.user_id = cookie_hash.hex()[-16:]
+        self.identity = identity_cache.get(cookie_hash)
+        # voice effects may modify the user's voice parameters, so the user has its own copy
+        self.voice_params = copy(self.identity.voice_params)
+        self.poke_params = self.identity.poke_params
+        self.poke_profile = self.identity.poke_profile
+        self.user_id = self.identity.user_id
         self.cookie_hash = cookie_hash
 
         self.channel = channel
         self.clients = [client]
         self.state = UserState()
-        self._info = None
 
     def __hash__(self):
         return self.user_id.__hash__()
@@ -189,49 +276,74 @@ class User:
         return self.user_id == other.user_id
 
     def throw_dice(self, type="attack") -> Tuple[int, int]:
-        bonus = (datetime.now() - self.state.last_attack).seconds // ATTACK_RESTING_TIME if type == "attack" else 0
+        bonus = int(clock.now() - self.state.last_attack) // ATTACK_RESTING_TIME if type == "attack" else 0
         return random.randint(1, 100), bonus
 
     @property
     def info(self):
-        if self._info is None:
-            self._info = {
-                'userid': self.user_id,
-                'params': {
-                    'name': self.poke_params.pokename,
-                    'img': str(self.poke_params.poke_id).zfill(3),
-                    'color': self.poke_params.color,
-                    'adjective': self.poke_params.poke_adj
-                },
-                'profile': self.poke_profile.to_dict()
-
-            }
-        return self._info
+        return self.identity.info
 
     @staticmethod
     def apply_effects(input_obj, effect_list: List['Effect']):
-        if effect_list:
-            for effect in effect_list:
-                if effect.is_expired():
-                    effect_list.remove(effect)  # if the effect has expired, remove it
-                else:
-                    try:
-                        input_obj = effect.process(input_obj)
-                    except Exception as e:
-                        logging.warning("Error while applying effect %s, error: \n %s"
-                                        % (effect.__class__.__name__, str(e)))
+        # the expired effects have already been removed from the list by their timer
+        for effect in effect_list:
+            try:
+                input_obj = effect.process(input_obj)
+            except Exception as e:
+                logging.warning("Error while applying effect %s, error: \n %s"
+                                % (effect.__class__.__name__, str(e)))
 
         return input_obj
 
+    @staticmethod
+    def effects_fingerprint(effect_list: List['Effect']):
+        """Returns a fingerprint of the active effects, or None if one of them isn't deterministic"""
+        if all(effect.DETERMINISTIC for effect in effect_list):
+            return tuple(effect.fingerprint for effect in effect_list)
+        return None
+
+    async def _vocode_stream(self, text: str, lang: str) -> AsyncIterator[bytes]:
+        """Renders a text and a language to wav chunks using espeak + mbrola, or fetches
+        the render from the cache if the same text was already rendered with the same voice"""
+        from tools import PhonemicEffect
+        voice_params = self._effective_voice_params()
+
+        fingerprint = self.effects_fingerprint(self.state.effects[PhonemicEffect])
+        if fingerprint is None:
+            async for chunk in self._synthesize(text, lang, voice_params):
+                yield chunk
+            return
+
+        cache = self.audio_renderer.render_cache  # type:RenderCache
+        cache_key = cache.make_key(text, lang, voice_params.speed, voice_params.pitch, voice_params.voice_id,
+                                   fingerprint)
+        wav = await cache.load(cache_key)
+        if wav is not None:
+            yield wav
+            return
+
+        chunks = []
+        async for chunk in self._synthesize(text, lang, voice_params):
+            chunks.append(chunk)
+            yield chunk
+        await cache.save(cache_key, self.audio_renderer.join_chunks(chunks))
+
     async def _vocode(self, text: str, lang: str) -> bytes:
         """Renders a text and a language to a wav bytes object using espeak + mbrola"""
-        # if there are voice effects, apply them to the voice renderer's voice and give them to the renderer
-        from tools import VoiceEffect, PhonemicEffect
-        if self.state.effects[VoiceEffect]:
-            voice_params = self.apply_effects(self.voice_params, self.state.effects[VoiceEffect])
-        else:
-            voice_params = self.voice_params
-
+        return self.audio_renderer.join_chunks([chunk async for chunk in self._vocode_stream(text, lang)])
+
+    async def _synthesize(self, text: str, lang: str, voice_params: VoiceParameters) -> AsyncIterator[bytes]:
+        """Waits for the render scheduler to give the synthesis its turn, or yields nothing if it's too late"""
+        if not await render_scheduler.acquire(self.user_id, RENDER_CHANNEL_PRIORITIES.get(self.channel, 0)):
+            return
+        try:
+            async for chunk in self._synthesize_now(text, lang, voice_params):
+                yield chunk
+        finally:
+            render_scheduler.release()
+
+    async def _synthesize_now(self, text: str, lang: str, voice_params: VoiceParameters) -> AsyncIterator[bytes]:
+        from tools import PhonemicEffect
         # apply the beep effect for spoilers
         beeped = await SpoilerBipEffect(self.audio_renderer, voice_params).process(text, lang)
 
@@ -250,31 +362,105 @@ class User:
                 modified_phonems = self.apply_effects(phonems, self.state.effects[PhonemicEffect])
 
             #rendering audio using the phonemlist
-            return await self.audio_renderer.phonemes_to_audio(modified_phonems, lang, voice_params)
+            chunks = self.audio_renderer.stream_phonemes_to_audio(modified_phonems, lang, voice_params)
         else:
             # regular render
-            return await self.audio_renderer.string_to_audio(text, lang, voice_params)
+            chunks = self.audio_renderer.stream_string_to_audio(text, lang, voice_params)
+
+        async for chunk in chunks:
+            yield chunk
 
-    async def render_message(self, text: str, lang: str):
-        from tools import ExplicitTextEffect, HiddenTextEffect, AudioEffect
+    def _render_text(self, text: str, lang: str) -> Tuple[str, str]:
+        """Returns the text displayed in the chat, and the text that is to be rendered to audio"""
+        from tools import ExplicitTextEffect, HiddenTextEffect
 
         cleaned_text = text[:500]
         # applying "explicit" effects (visible to the users)
         displayed_text = self.apply_effects(cleaned_text, self.state.effects[ExplicitTextEffect])
         # applying "hidden" texts effects (invisible on the chat, only heard in the audio)
         rendered_text = self.apply_effects(displayed_text, self.state.effects[HiddenTextEffect])
-        rendered_text = prepare_text_for_tts(rendered_text, lang)
+        return displayed_text, prepare_text_for_tts(rendered_text, lang)
+
+    @property
+    def can_stream(self):
+        """Audio effects need the whole render, so they prevent it from being streamed"""
+        from tools import AudioEffect
+        return not self.state.effects[AudioEffect]
+
+    def _effective_voice_params(self) -> VoiceParameters:
+        """The user's voice, once the voice effects (if there are some) are applied to it. They're applied
+        to a copy of it, since some of them modify the parameters they're given"""
+        from tools import VoiceEffect
+        if self.state.effects[VoiceEffect]:
+            return self.apply_effects(copy(self.voice_params), self.state.effects[VoiceEffect])
+        return self.voice_params
+
+    @property
+    def _calibrates_estimates(self) -> bool:
+        """The phonemic and audio effects change the renders' sizes in their own way, so these renders aren't
+        used to calibrate the estimates, which are shared by all the users"""
+        from tools import PhonemicEffect, AudioEffect
+        return not (self.state.effects[PhonemicEffect] or self.state.effects[AudioEffect])
+
+    def _phonemes_duration(self, text: str, lang: str, voice_params: VoiceParameters) -> Optional[int]:
+        """Duration (in milliseconds) of the text's phonemes, if they're already known"""
+        phonemes = self.audio_renderer.cached_phonemes(text, lang, voice_params)
+        return sum(phonem.duration for phonem in phonemes) if phonemes is not None else None
+
+    @staticmethod
+    def _may_fit(text: str, speed: int, phonemes_duration: Optional[int], max_size: Optional[float]) -> bool:
+        return max_size is None or render_estimator.fits(text, speed, max_size, phonemes_duration)
+
+    async def _calibrated(self, text: str, speed: int, phonemes_duration: Optional[int],
+                          chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+        if self._calibrates_estimates:
+            render_estimator.calibrate(text, speed, size, phonemes_duration)
+
+    @staticmethod
+    async def _no_chunks() -> AsyncIterator[bytes]:
+        for chunk in ():
+            yield chunk
+
+    def stream_message(self, text: str, lang: str, max_size: float = None) -> Tuple[str, AsyncIterator[bytes]]:
+        """Same as render_message, but the audio is yielded in chunks, as it's rendered. The first chunk
+        holds the wav header, with its size fields unset. Only usable if the user can stream."""
+        displayed_text, rendered_text = self._render_text(text, lang)
+        voice_params = self._effective_voice_params()
+        phonemes_duration = self._phonemes_duration(rendered_text, lang, voice_params)
+        if not self._may_fit(rendered_text, voice_params.speed, phonemes_duration, max_size):
+            return displayed_text, self._no_chunks()
+        return displayed_text, self._calibrated(rendered_text, voice_params.speed, phonemes_duration,
+                                                self._vocode_stream(rendered_text, lang))
+
+    async def render_message(self, text: str, lang: str, max_size: float = None):
+        """Returns the text displayed in the chat, and its audio render. If the audio would most likely be
+        bigger than max_size (in bytes), it isn't rendered."""
+        from tools import AudioEffect
+
+        displayed_text, rendered_text = self._render_text(text, lang)
+        voice_params = self._effective_voice_params()
+        phonemes_duration = self._phonemes_duration(rendered_text, lang, voice_params)
+        if not self._may_fit(rendered_text, voice_params.speed, phonemes_duration, max_size):
+            return displayed_text, b""
 
         # rendering the audio from the text
         wav = await self._vocode(rendered_text, lang)
 
+        audio_effects = self.state.effects[AudioEffect]
+
         # if there are effets in the audio_effect list, we run it
-        if self.state.effects[AudioEffect]:
+        if audio_effects and wav:
             # converting to f32 (more standard) and resampling to 16k if needed, and converting to a ndarray
             rate , data = await self.audio_renderer.to_f32_16k(wav)
-            # applying the effects pipeline to the sound
-            data = self.apply_effects(data, self.state.effects[AudioEffect])
+            # applying the effects pipeline to the sound, out of the event loop
+            data = await self.audio_renderer.effects_pool.apply(data, audio_effects)
             # converting the sound's ndarray back to bytes
             wav = self.audio_renderer.to_wav_bytes(data, rate)
 
+        if self._calibrates_estimates:
+            render_estimator.calibrate(rendered_text, voice_params.speed, len(wav), phonemes_duration)
         return displayed_text, wav
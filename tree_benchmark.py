@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""Compares the verbs trie used by the contradictor effect to the tree of nodes (one python object and
+one dict per character) it replaced: the memory they use once built, how long a lookup takes, and how
+long it takes to get them from their file (unpickling the tree, memory-mapping the trie).
+
+Usage: python3 tree_benchmark.py [lookups count]"""
+import pickle
+import random
+import sys
+import tracemalloc
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tools.effects.tree import Trie
+from tools.lexicon import VERBS_LIST_FILEPATH
+
+
+class Leaf:
+
+    def __init__(self, word: str):
+        self.str = word
+
+    def pop_first(self):
+        if self.str:
+            out = self.str[0]
+            self.str = self.str[1:]
+            return out
+        else:
+            raise IndexError()
+
+    def has_leaf(self, leaf):
+        return True
+
+    @property
+    def isnull(self):
+        return not self.str
+
+
+class Node:
+    """The former tree, whose lookups consume the leaf they're given"""
+
+    def __init__(self):
+        self.children = dict()
+        self.isleaf = False
+
+    def add_leaf(self, leaf: Leaf):
+        try:
+            leaf_first_letter = leaf.pop_first()
+            if leaf_first_letter in self.children:
+                child = self.children[leaf_first_letter]
+                if isinstance(child, Leaf):
+                    new_child = Node()
+                    self.children[leaf_first_letter] = new_child
+                    new_child.add_leaf(child)
+                    new_child.add_leaf(leaf)
+                elif isinstance(child, Node):
+                    child.add_leaf(leaf)
+            else:
+                self.children[leaf_first_letter] = leaf
+        except IndexError:
+            self.isleaf = True
+
+    def has_leaf(self, leaf: Leaf) -> bool:
+        if leaf.isnull:
+            return self.isleaf
+        else:
+            leaf_first_letter = leaf.pop_first()
+            if leaf_first_letter in self.children:
+                return self.children[leaf_first_letter].has_leaf(leaf)
+            else:
+                return False
+
+
+def build_tree(verbs):
+    tree = Node()
+    for verb in verbs:
+        tree.add_leaf(Leaf(verb))
+    return tree
+
+
+def measure_build(build, verbs):
+    """Returns the built structure, the memory it holds and the time it took to build it"""
+    tracemalloc.start()
+    start = perf_counter()
+    built = build(verbs)
+    duration = perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, size, duration
+
+
+def measure_lookups(lookup, words):
+    start = perf_counter()
+    for word in words:
+        lookup(word)
+    return (perf_counter() - start) / len(words)
+
+
+if __name__ == "__main__":
+    lookups_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with open(VERBS_LIST_FILEPATH) as verbs_file:
+        verbs = [verb.strip() for verb in verbs_file if verb.strip()]
+    # half of the looked up words are verbs, the others are verbs with an extra letter
+    words = [random.choice(verbs) + random.choice(["", "z"]) for _ in range(lookups_count)]
+
+    tree, tree_size, tree_build = measure_build(build_tree, verbs)
+    trie, trie_size, trie_build = measure_build(Trie.from_words, verbs)
+    tree_lookup = measure_lookups(lambda word: tree.has_leaf(Leaf(word)), words)
+    trie_lookup = measure_lookups(lambda word: word in trie, words)
+    with TemporaryDirectory() as folder:
+        tree_filepath, trie_filepath = path.join(folder, "verbs.pckl"), path.join(folder, "verbs.dawg")
+        with open(tree_filepath, "wb") as tree_file:
+            pickle.dump(tree, tree_file)
+        trie.save(trie_filepath)
+        start = perf_counter()
+        with open(tree_filepath, "rb") as tree_file:
+            pickle.load(tree_file)
+        tree_load = perf_counter() - start
+        start = perf_counter()
+        loaded = Trie.load(trie_filepath)
+        trie_load = perf_counter() - start
+        trie_lookup_mapped = measure_lookups(lambda word: word in loaded, words)
+        files_sizes = path.getsize(tree_filepath), path.getsize(trie_filepath)
+
+    print("%d verbs, %d lookups" % (len(verbs), lookups_count))
+    print("%-18s | %12s | %12s" % ("", "tree", "trie"))
+    print("%-18s | %12d | %12d" % ("memory (bytes)", tree_size, trie_size))
+    print("%-18s | %12d | %12d" % ("file (bytes)", *files_sizes))
+    print("%-18s | %12.1f | %12.1f" % ("build (ms)", tree_build * 1e3, trie_build * 1e3))
+    print("%-18s | %12.1f | %12.1f" % ("load (ms)", tree_load * 1e3, trie_load * 1e3))
+    print("%-18s | %12.2f | %12.2f" % ("lookup (µs)", tree_lookup * 1e6, trie_lookup * 1e6))
+    print("%-18s | %12s | %12.2f" % ("mapped lookup (µs)", "", trie_lookup_mapped * 1e6))